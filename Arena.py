@@ -0,0 +1,286 @@
+import argparse
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from Grid import Grid
+from GameTree import generate_moves, make_move
+from MonteCarloTree import get_winner
+from OpeningBook import BOOK_PATH
+from Player1 import PlayerOne
+from Player2 import PlayerTwo
+from PlayerMCTS import PlayerMCTS
+
+# Games still running after this many moves are counted as draws
+MAX_TURNS = 300
+# Random plies each pair of games starts with, so that deterministic engines do not play the
+# same two games over and over
+OPENING_PLIES = 4
+
+"""
+Parses an engine configuration such as "minimax:depth=3", "minimax:time=0.5,memo=0" or
+"mcts:iterations=500,evaluate=1". memo sets how many moves a minimax engine keeps in its
+overflow memo, and memo=0 switches the memo off. book=1 and solver=1 let a minimax engine use
+the opening book and the endgame solver, which are off in the arena so that the games compare
+the searches themselves.
+
+Parameters:
+    text (str): The engine type, optionally followed by a colon and comma-separated settings.
+
+Returns:
+    dict: The configuration, with the engine type under "engine".
+"""
+
+
+def parse_config(text):
+    engine, _, settings = text.partition(":")
+    if engine not in ("minimax", "mcts"):
+        raise ValueError("unknown engine type {!r}".format(engine))
+    config = {"engine": engine}
+    for setting in filter(None, settings.split(",")):
+        name, _, value = setting.partition("=")
+        if name in ("depth", "iterations", "memo"):
+            config[name] = int(value)
+        elif name == "time":
+            config[name] = float(value)
+        elif name in ("evaluate", "book", "solver"):
+            config[name] = value not in ("0", "false", "")
+        else:
+            raise ValueError("unknown setting {!r}".format(name))
+    return config
+
+
+"""
+Returns a player object for the configuration, playing the given side.
+"""
+
+
+def make_player(config, player):
+    if config["engine"] == "mcts":
+        bot = PlayerMCTS(player, evaluate=config.get("evaluate", False))
+        if "iterations" in config:
+            bot.change_difficulty(config["iterations"])
+    else:
+        book = BOOK_PATH if config.get("book", False) else None
+        solver = config.get("solver", False)
+        if player == 1:
+            bot = PlayerOne(book=book, solver=solver)
+        else:
+            bot = PlayerTwo(book=book, solver=solver)
+        if "depth" in config:
+            bot.change_difficulty(config["depth"])
+        if "memo" in config:
+            bot.change_memo(config["memo"])
+    bot.change_time_budget(config.get("time"))
+    return bot
+
+
+"""
+Returns the standard start position: a cell for player 1 in the top left corner and one for
+player 2 in the bottom right corner.
+"""
+
+
+def start_board(rows, cols):
+    board = Grid(rows, cols)
+    board.set(0, 0, 1)
+    board.set(rows - 1, cols - 1, -1)
+    return board
+
+
+"""
+Picks random opening moves from the standard start position, player 1 first.
+
+Parameters:
+    rows (int): Number of rows of the board.
+    cols (int): Number of columns of the board.
+    plies (int): Number of moves to pick.
+    seed (int): Seed of the random choices, so the same seed gives the same opening.
+
+Returns:
+    list: The moves as flat indices. The opening stops early if a move wins the game.
+"""
+
+
+def random_opening(rows, cols, plies, seed):
+    rng = random.Random(seed)
+    board = start_board(rows, cols)
+    player = 1
+    opening = []
+    for _ in range(plies):
+        index = rng.choice(generate_moves(board, player))
+        board = make_move(board, index, player)
+        opening.append(index)
+        if get_winner(board):
+            break
+        player = -player
+    return opening
+
+
+"""
+Plays one game between two engine configurations from the standard start position, after the
+given opening moves.
+
+Parameters:
+    config_a (dict): Configuration of engine A.
+    config_b (dict): Configuration of engine B.
+    a_first (bool): Whether engine A plays player 1 (who moves first).
+    rows (int): Number of rows of the board.
+    cols (int): Number of columns of the board.
+    game (int): Number of the game, passed back in the result.
+    opening (list): Flat indices of the moves played before the engines take over, player 1
+        first (see random_opening).
+
+Returns:
+    dict: The game number, the result for engine A (1 win, 0 draw, -1 loss), the number of
+        moves, and the moves and seconds spent thinking by each engine.
+"""
+
+
+def play_game(config_a, config_b, a_first, rows, cols, game=0, opening=()):
+    board = start_board(rows, cols)
+    player = 1
+    for index in opening:
+        board = make_move(board, index, player)
+        player = -player
+    a_player = 1 if a_first else -1
+    bots = {a_player: make_player(config_a, a_player),
+            -a_player: make_player(config_b, -a_player)}
+    moves = {a_player: 0, -a_player: 0}
+    seconds = {a_player: 0.0, -a_player: 0.0}
+
+    winner = get_winner(board)
+    turns = 0
+    while not winner and turns < MAX_TURNS:
+        start = time.perf_counter()
+        move = bots[player].get_play(board.clone())
+        seconds[player] += time.perf_counter() - start
+        moves[player] += 1
+        index = board.index(*move)
+        if not board.is_legal(index, player):
+            # An invalid move loses the game, as in main.py
+            winner = -player
+            break
+        board = make_move(board, index, player)
+        bots[-player].opponent_played(move, board)
+        turns += 1
+        winner = get_winner(board)
+        if winner:
+            break
+        player = -player
+    for bot in bots.values():
+        bot.close()
+
+    return {
+        "game": game,
+        "result": winner * a_player,
+        "turns": turns,
+        "moves_a": moves[a_player],
+        "seconds_a": seconds[a_player],
+        "moves_b": moves[-a_player],
+        "seconds_b": seconds[-a_player],
+    }
+
+
+"""
+Plays a match of several games between two engine configurations, spread over worker processes,
+and yields each game's result (see play_game) as soon as it is finished. The games are played
+in pairs: both games of a pair start with the same random opening and the engines swap sides
+between them, and every pair gets another opening.
+
+Parameters:
+    config_a (dict): Configuration of engine A.
+    config_b (dict): Configuration of engine B.
+    games (int): Number of games to play.
+    workers (int): Number of worker processes; 1 plays the games in this process.
+    rows (int): Number of rows of the board.
+    cols (int): Number of columns of the board.
+    opening_plies (int): Number of random moves each pair of games starts with.
+    seed (int): Seed of the random openings; pair p uses seed + p.
+"""
+
+
+def run_match(config_a, config_b, games, workers=None, rows=5, cols=6,
+              opening_plies=OPENING_PLIES, seed=0):
+    if workers is None:
+        workers = os.cpu_count() or 1
+    openings = [random_opening(rows, cols, opening_plies, seed + pair)
+                for pair in range((games + 1) // 2)]
+    if workers <= 1:
+        for game in range(games):
+            yield play_game(config_a, config_b, game % 2 == 0, rows, cols, game,
+                            openings[game // 2])
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(play_game, config_a, config_b, game % 2 == 0, rows, cols, game,
+                                   openings[game // 2])
+                   for game in range(games)]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+"""
+Sums up a match.
+
+Parameters:
+    results (list): The results of the games, as returned by play_game.
+    elapsed (float): Wall-clock seconds the match took.
+
+Returns:
+    dict: Wins, draws and losses of engine A, the average seconds per move of each engine and
+        the number of games played per second.
+"""
+
+
+def summarize(results, elapsed):
+    moves_a = sum(result["moves_a"] for result in results)
+    moves_b = sum(result["moves_b"] for result in results)
+    return {
+        "games": len(results),
+        "wins": sum(result["result"] == 1 for result in results),
+        "draws": sum(result["result"] == 0 for result in results),
+        "losses": sum(result["result"] == -1 for result in results),
+        "move_time_a": sum(result["seconds_a"] for result in results) / moves_a if moves_a else 0.0,
+        "move_time_b": sum(result["seconds_b"] for result in results) / moves_b if moves_b else 0.0,
+        "games_per_second": len(results) / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Play games between two engine configurations without the pygame window.")
+    parser.add_argument("engine_a", type=parse_config,
+                        help='engine A, e.g. "minimax:depth=3" or "mcts:iterations=500"')
+    parser.add_argument("engine_b", type=parse_config, help="engine B")
+    parser.add_argument("-n", "--games", type=int, default=10)
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="worker processes (default: one per core)")
+    parser.add_argument("--rows", type=int, default=5)
+    parser.add_argument("--cols", type=int, default=6)
+    parser.add_argument("--opening-plies", type=int, default=OPENING_PLIES,
+                        help="random moves each pair of games starts with (default {})".format(
+                            OPENING_PLIES))
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random openings")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    results = []
+    for result in run_match(args.engine_a, args.engine_b, args.games, args.workers, args.rows,
+                            args.cols, args.opening_plies, args.seed):
+        results.append(result)
+        print("game {:3d}: {:4s} in {} moves".format(
+            result["game"] + 1, {1: "win", 0: "draw", -1: "loss"}[result["result"]],
+            result["turns"]), flush=True)
+    summary = summarize(results, time.perf_counter() - start)
+
+    print("A wins {wins}, draws {draws}, losses {losses} of {games} games".format(**summary))
+    print("average move time: A {:.3f}s, B {:.3f}s".format(
+        summary["move_time_a"], summary["move_time_b"]))
+    print("{:.2f} games per second".format(summary["games_per_second"]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,198 @@
+from Overflow import overflow
+from Evaluation import IncrementalEvaluator
+
+# NumPy is optional: without it every function here falls back to the scalar overflow and
+# evaluation, one board at a time
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Whether the vectorised path is available
+BATCH_AVAILABLE = numpy is not None
+
+# Per-board-size arrays used by the vectorised evaluation, built on first use
+_tables = {}
+
+# Boards with more cells than this are scored one child at a time: each batch works on whole
+# boards, while the scalar path only rescores the few cells around each move, which wins on big
+# boards (and keeps the stacked copies of the board small)
+BATCH_MAX_CELLS = 1024
+
+
+# Return (thresholds, position scores, potential divisors, 3x3 area sizes) as (rows, cols)
+# arrays for the topology
+def get_tables(topology):
+    tables = _tables.get((topology.rows, topology.cols))
+    if tables is None:
+        shape = (topology.rows, topology.cols)
+        tables = _tables[(topology.rows, topology.cols)] = (
+            numpy.array(topology.thresholds, dtype=numpy.int16).reshape(shape),
+            numpy.array(topology.position_scores, dtype=numpy.float64).reshape(shape),
+            numpy.array(topology.potential_divisors, dtype=numpy.float64).reshape(shape),
+            numpy.array([len(area) for area in topology.areas],
+                        dtype=numpy.int64).reshape(shape),
+        )
+    return tables
+
+
+# Return, for every cell of a stack of boards, how many of its orthogonal neighbours are set in
+# the mask
+def neighbour_counts(mask):
+    counts = numpy.zeros(mask.shape, dtype=numpy.int16)
+    counts[:, 1:, :] += mask[:, :-1, :]
+    counts[:, :-1, :] += mask[:, 1:, :]
+    counts[:, :, 1:] += mask[:, :, :-1]
+    counts[:, :, :-1] += mask[:, :, 1:]
+    return counts
+
+
+# Return, for every cell of a stack of boards, the sum of the values over its 3x3 neighbourhood
+# (the cell included, cells off the board left out)
+def area_sums(values):
+    n, rows, cols = values.shape
+    padded = numpy.zeros((n, rows + 2, cols + 2), dtype=values.dtype)
+    padded[:, 1:-1, 1:-1] = values
+    sums = numpy.zeros(values.shape, dtype=values.dtype)
+    for i in range(3):
+        for j in range(3):
+            sums += padded[:, i:i + rows, j:j + cols]
+    return sums
+
+
+"""
+Plays out the overflow of a stack of boards at once. Each wave follows the scalar overflow
+exactly: every cell at or above its threshold is emptied, and every neighbour of an emptied cell
+takes the sign of the first overflowing cell in row-major order and gains one gem per emptied
+neighbour. A board stops once it has no overflowing cell or only one colour left.
+
+Parameters:
+    cells (numpy.ndarray): int8 array of shape (n, rows, cols), changed in place.
+    thresholds (numpy.ndarray): The (rows, cols) overflow thresholds of the board size.
+    max_waves (int): Optional cap on the number of waves per board (see Grid.max_waves).
+
+Returns:
+    numpy.ndarray: The number of waves each board took.
+"""
+
+
+def overflow_stack(cells, thresholds, max_waves=None):
+    n = cells.shape[0]
+    waves = numpy.zeros(n, dtype=numpy.int64)
+    active = numpy.ones(n, dtype=bool)
+    while True:
+        values = cells.astype(numpy.int16)
+        over = (numpy.abs(values) >= thresholds) & active[:, None, None]
+        flat_over = over.reshape(n, -1)
+        has_over = flat_over.any(axis=1)
+        positive = (values > 0).reshape(n, -1).any(axis=1)
+        negative = (values < 0).reshape(n, -1).any(axis=1)
+        active &= has_over & positive & negative
+        if max_waves is not None:
+            active &= waves < max_waves
+        if not active.any():
+            return waves
+        over &= active[:, None, None]
+
+        # The sign of the first overflowing cell of each board
+        first = flat_over.argmax(axis=1)
+        signs = numpy.where(values.reshape(n, -1)[numpy.arange(n), first] > 0, 1, -1)
+        signs = signs.astype(numpy.int16)[:, None, None]
+
+        values[over] = 0
+        counts = neighbour_counts(over)
+        fed = counts > 0
+        values = numpy.where(fed, (numpy.abs(values) + counts) * signs, values)
+        cells[...] = values
+        waves += active
+
+
+"""
+Scores a stack of boards for a player. The results are identical to evaluate_board: every cell
+score is a multiple of 0.25 (see Topology.exact_scores), so summing them in another order gives
+the same floating point totals.
+
+Parameters:
+    cells (numpy.ndarray): int8 array of shape (n, rows, cols).
+    topology (Topology): The topology of the board size.
+    player (int): The player to score the boards for.
+
+Returns:
+    list: The evaluation of every board.
+"""
+
+
+def evaluate_stack(cells, topology, player):
+    _, position_scores, potential_divisors, area_sizes = get_tables(topology)
+    win_score = topology.size * 20
+    values = cells.astype(numpy.int64) * player
+
+    # The same terms as score_cell, computed for every cell at once
+    overflow_potential = (numpy.abs(values) / potential_divisors) * position_scores
+    enemy_gems = area_sums(numpy.where(values < 0, -values, 0))
+    allies = area_sums((values > 0).astype(numpy.int64))
+    neutral = area_sizes - area_sums((values != 0).astype(numpy.int64))
+    capture_potential = enemy_gems * 0.5
+    strategic_value = allies + neutral * 0.5
+    scores = overflow_potential + capture_potential + strategic_value
+
+    own = values > 0
+    player_points = numpy.where(own, scores, 0.0).sum(axis=(1, 2))
+    opponent_points = numpy.where(values < 0, scores, 0.0).sum(axis=(1, 2))
+    has_own = own.any(axis=(1, 2))
+    has_opponent = (values < 0).any(axis=(1, 2))
+
+    results = []
+    for board in range(cells.shape[0]):
+        if not has_own[board]:
+            results.append(-win_score)
+        elif not has_opponent[board]:
+            results.append(win_score)
+        else:
+            results.append(float(player_points[board]) - float(opponent_points[board]))
+    return results
+
+
+"""
+Plays each of a player's moves on a board and scores the resulting positions for a perspective,
+all siblings in one batch when NumPy is available and the board is not too big, and one by one
+otherwise.
+
+Parameters:
+    board (Grid): The position the moves are played on.
+    moves (list): Flat indices of the moves.
+    player (int): The player making the moves.
+    perspective (int): The player the positions are scored for.
+    stats (SearchStats): Optional statistics that count the moves and their overflow waves.
+
+Returns:
+    list: The evaluation of the position after each move, as evaluate_board gives it.
+"""
+
+
+def score_moves(board, moves, player, perspective, stats=None):
+    topology = board.topology
+    if numpy is None or not topology.exact_scores or board.size > BATCH_MAX_CELLS:
+        scores = []
+        # Each child only differs from the board around its move, so it is scored incrementally
+        evaluator = IncrementalEvaluator(board, perspective)
+        for index in moves:
+            child = board.clone()
+            child.add(index, player)
+            changed = {index}
+            waves = overflow(child, changed=changed, start=board.overflow_start(index))
+            if stats is not None:
+                stats.moves += 1
+                stats.waves += waves
+            scores.append(evaluator.child(child, changed, True).score())
+        return scores
+
+    n = len(moves)
+    flat = numpy.tile(numpy.frombuffer(board.cells, dtype=numpy.int8), (n, 1))
+    flat[numpy.arange(n), moves] += player
+    cells = flat.reshape(n, board.height, board.width)
+    waves = overflow_stack(cells, get_tables(topology)[0], board.max_waves)
+    if stats is not None:
+        stats.moves += n
+        stats.waves += int(waves.sum())
+    return evaluate_stack(cells, topology, perspective)
@@ -0,0 +1,296 @@
+import argparse
+import gc
+import json
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+from Grid import Grid
+from Evaluation import evaluate_board
+from GameTree import GameTree, generate_moves, make_move
+from MonteCarloTree import get_winner
+from OverflowMemo import MEMO_ENTRIES, OverflowMemo
+
+# Tree heights timed for the full search, one per difficulty
+DIFFICULTIES = (2, 3, 4)
+# Timings that get slower than the baseline by more than this fraction are flagged
+THRESHOLD = 0.10
+# ...but only when they also got slower by more than this many seconds per call: timings this
+# short move by more than the threshold from one run to the next on their own
+NOISE_SECONDS = 0.001
+# Every benchmark is timed in batches of calls that take at least BATCH_SECONDS each, so that
+# short calls are not lost in the timer's resolution
+BATCH_SECONDS = 0.02
+# Number of batches timed per benchmark. The batches are taken in rounds over all benchmarks, so
+# that a stretch of time in which the rest of the machine slows everything down costs each
+# benchmark one batch rather than all of them.
+ROUNDS = 7
+
+
+"""
+Times every function in ROUNDS batches (see BATCH_SECONDS) and returns, per function, its result
+and the median seconds one call took over its batches. The median is kept because single
+batches are often slowed down by the rest of the machine, which the mean would count and the
+fastest batch would hide to varying degrees. As in timeit, the garbage collector is kept from
+running while a batch is timed, so that no batch pays for the garbage of the ones before it.
+"""
+
+
+def timed(functions):
+    results = []
+    calls = []
+    times = []
+    # Find how many calls make up a batch of each function
+    for function in functions:
+        count = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < BATCH_SECONDS:
+            result = function()
+            count += 1
+        results.append(result)
+        calls.append(count)
+        times.append([])
+    for _ in range(ROUNDS):
+        for function, count, samples in zip(functions, calls, times):
+            gc.collect()
+            gc.disable()
+            try:
+                start = time.perf_counter()
+                for _ in range(count):
+                    function()
+                samples.append((time.perf_counter() - start) / count)
+            finally:
+                gc.enable()
+    return [(result, statistics.median(samples)) for result, samples in zip(results, times)]
+
+
+"""
+Returns the fixed benchmark positions as (name, board, player to move) tuples: the standard
+start, a midgame reached by a seeded random game, and a board where one move sets off a long
+overflow cascade.
+"""
+
+
+def get_positions(rows=5, cols=6):
+    opening = Grid(rows, cols)
+    opening.set(0, 0, 1)
+    opening.set(rows - 1, cols - 1, -1)
+
+    midgame = opening.clone()
+    rng = random.Random("benchmark midgame")
+    player = 1
+    for _ in range(16):
+        midgame = make_move(midgame, rng.choice(
+            generate_moves(midgame, player)), player)
+        if get_winner(midgame):
+            raise RuntimeError("the benchmark midgame ended early")
+        player = -player
+
+    # The top two rows one gem short of overflowing and a row of single gems of player 2 at the
+    # bottom, so a move at the top sets off a cascade of several waves without ending the game
+    cascade = Grid(rows, cols)
+    for index, threshold in enumerate(cascade.topology.thresholds):
+        if index < 2 * cols:
+            cascade.add(index, threshold - 1)
+        elif index >= (rows - 1) * cols:
+            cascade.add(index, -1)
+
+    return [("opening", opening, 1), ("midgame", midgame, player), ("cascade", cascade, 1)]
+
+
+"""
+Counts the positions reachable in exactly depth plies, playing out the overflow of every move.
+Won positions are not played on, so they only count at the ply they are reached. With an
+OverflowMemo, moves reached again through another move order are taken from the memo.
+"""
+
+
+def perft(board, player, depth, memo=None):
+    if depth == 0:
+        return 1
+    nodes = 0
+    for index in generate_moves(board, player):
+        child = make_move(board, index, player, memo=memo)
+        if depth == 1:
+            nodes += 1
+        elif not get_winner(child):
+            nodes += perft(child, -player, depth - 1, memo)
+    return nodes
+
+
+"""
+Runs the benchmarks on every position.
+
+Parameters:
+    max_depth (int): The deepest perft depth to count.
+    rows (int): Number of rows of the board.
+    cols (int): Number of columns of the board.
+    memo_entries (int): Size of the OverflowMemo that every perft and search run starts with
+        (empty), or 0 to run without one.
+
+Returns:
+    dict: Results per position name: perft node counts and timings, the evaluate_board time per
+        call, per difficulty the search time, nodes, nodes per second, peak memory and overflow
+        memo counters.
+"""
+
+
+def run_benchmarks(max_depth=4, rows=5, cols=6, memo_entries=MEMO_ENTRIES):
+    def new_memo():
+        return OverflowMemo(memo_entries) if memo_entries else None
+
+    # The functions timed for each benchmark; every run starts with an empty memo
+    def run_perft(board, player, depth):
+        return lambda: perft(board, player, depth, new_memo())
+
+    def run_evaluate(board, player):
+        return lambda: evaluate_board(board, player)
+
+    def run_search(board, player, height):
+        return lambda: GameTree(board, player, height, memo=new_memo())
+
+    # Every benchmark as (position name, kind, depth or height, function), timed together below
+    benchmarks = []
+    positions = get_positions(rows, cols)
+    for name, board, player in positions:
+        for depth in range(1, max_depth + 1):
+            benchmarks.append((name, "perft", depth, run_perft(board, player, depth)))
+        benchmarks.append((name, "evaluate", None, run_evaluate(board, player)))
+        for height in DIFFICULTIES:
+            benchmarks.append((name, "search", height, run_search(board, player, height)))
+    timings = timed([benchmark[3] for benchmark in benchmarks])
+
+    results = {name: {"perft": {}, "search": {}} for name, _, _ in positions}
+    boards = {name: (board, player) for name, board, player in positions}
+    for (name, kind, level, _), (value, seconds) in zip(benchmarks, timings):
+        result = results[name]
+        if kind == "perft":
+            result["perft"][str(level)] = {
+                "nodes": value,
+                "seconds": seconds,
+                "nodes_per_second": value / seconds if seconds > 0 else 0.0,
+            }
+        elif kind == "evaluate":
+            result["evaluate_seconds"] = seconds
+        else:
+            # Peak memory and the memo counters are taken from another run, as tracing slows
+            # the search down
+            board, player = boards[name]
+            memo = new_memo()
+            tracemalloc.start()
+            GameTree(board, player, level, memo=memo)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            result["search"][str(level)] = {
+                "nodes": value.nodes,
+                "seconds": seconds,
+                "nodes_per_second": value.nodes / seconds if seconds > 0 else 0.0,
+                "peak_bytes": peak,
+                "move": value.get_move(),
+                "memo": memo.stats() if memo is not None else None,
+            }
+    return results
+
+
+"""
+Compares results against a baseline run.
+
+Parameters:
+    results (dict): The current results, as returned by run_benchmarks.
+    baseline (dict): Earlier results in the same format.
+    threshold (float): Fraction by which a timing may grow before it is flagged.
+
+Returns:
+    list: A message for every timing that got slower than the threshold and NOISE_SECONDS
+        allow, and for every node count or chosen move that differs from the baseline.
+"""
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    problems = []
+
+    def check_time(label, seconds, old_seconds):
+        slower = seconds - old_seconds
+        if old_seconds > 0 and slower > old_seconds * threshold and slower > NOISE_SECONDS:
+            problems.append("{} slowed down by {:.0%} ({:.4f}s -> {:.4f}s)".format(
+                label, seconds / old_seconds - 1, old_seconds, seconds))
+
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        for depth, perft_result in result["perft"].items():
+            old_perft = old["perft"].get(depth)
+            if old_perft is None:
+                continue
+            label = "{} perft {}".format(name, depth)
+            if perft_result["nodes"] != old_perft["nodes"]:
+                problems.append("{} counts {} nodes, the baseline {}".format(
+                    label, perft_result["nodes"], old_perft["nodes"]))
+            check_time(label, perft_result["seconds"], old_perft["seconds"])
+        check_time("{} evaluate_board".format(name),
+                   result["evaluate_seconds"], old["evaluate_seconds"])
+        for height, search in result["search"].items():
+            old_search = old["search"].get(height)
+            if old_search is None:
+                continue
+            label = "{} search height {}".format(name, height)
+            if list(search["move"] or []) != list(old_search["move"] or []):
+                problems.append("{} chose {}, the baseline {}".format(
+                    label, search["move"], old_search["move"]))
+            check_time(label, search["seconds"], old_search["seconds"])
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark move generation, overflow, evaluation and search.")
+    parser.add_argument("-d", "--depth", type=int, default=4,
+                        help="deepest perft depth (default 4)")
+    parser.add_argument("-o", "--output", help="save the results to this JSON file")
+    parser.add_argument("-b", "--baseline", help="compare against the results in this JSON file")
+    parser.add_argument("-t", "--threshold", type=float, default=THRESHOLD,
+                        help="flag timings that are slower than the baseline by more than this "
+                             "fraction (default 0.10)")
+    parser.add_argument("--no-memo", action="store_true",
+                        help="play every move out without the overflow memo")
+    parser.add_argument("--rows", type=int, default=5)
+    parser.add_argument("--cols", type=int, default=6)
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.depth, args.rows, args.cols,
+                             0 if args.no_memo else MEMO_ENTRIES)
+    for name, result in results.items():
+        print(name)
+        for depth, perft_result in result["perft"].items():
+            print("  perft {}: {:9d} nodes {:8.3f}s {:10.0f} nodes/s".format(
+                depth, perft_result["nodes"], perft_result["seconds"],
+                perft_result["nodes_per_second"]))
+        print("  evaluate_board: {:.1f}us".format(
+            result["evaluate_seconds"] * 1e6))
+        for height, search in result["search"].items():
+            print("  search height {}: {:7d} nodes {:8.3f}s {:10.0f} nodes/s {:8.1f} KiB peak".format(
+                height, search["nodes"], search["seconds"], search["nodes_per_second"],
+                search["peak_bytes"] / 1024))
+            if search["memo"] is not None:
+                print("    overflow memo: {} hits, {} misses".format(
+                    search["memo"]["hits"], search["memo"]["misses"]))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            problems = compare(results, json.load(file), args.threshold)
+        for problem in problems:
+            print("REGRESSION: " + problem)
+        if problems:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+def evaluate_board(board, player):
+    cells = board.cells
+    topology = board.topology
+    win_score = board.size * 20
+    player_points, opponent_points = 0, 0
+
+    # Every occupied cell scores more than zero, so a side without cells has no points; the
+    # board's cell counts settle won positions without scoring any cell
+    if board.cell_count(player) == 0:
+        return -win_score
+    elif board.cell_count(-player) == 0:
+        return win_score
+
+    # Only the occupied cells score, in row-major order
+    occupied = board.occupied_cells()
+    if player == 1:
+        for index in occupied:
+            if cells[index] > 0:
+                player_points += score_cell(cells, topology, player, index)
+            else:
+                opponent_points += score_cell(cells, topology, player, index)
+
+        if player_points == 0:
+            return -win_score
+        elif opponent_points == 0:
+            return win_score
+        else:
+            return player_points - abs(opponent_points)
+
+    elif player == -1:
+        for index in occupied:
+            if cells[index] < 0:
+                player_points += score_cell(cells, topology, player, index)
+            else:
+                opponent_points += score_cell(cells, topology, player, index)
+
+        if player_points == 0:
+            return -win_score
+        elif opponent_points == 0:
+            return win_score
+        else:
+            return abs(player_points) - opponent_points
+
+
+def cell_score(board, player, row, col):
+    return score_cell(board.cells, board.topology, player, board.index(row, col))
+
+
+def score_cell(cells, topology, player, index):
+    # Corners are worth the most, then edges, then center cells (see Topology)
+    position_score = topology.position_scores[index]
+    overflow_potential = (
+        abs(cells[index]) / topology.potential_divisors[index]) * position_score
+
+    # Scan the 3x3 neighbourhood once for both the capture and the strategic value
+    enemy_gems = 0
+    strategic_value = 0
+    for neighbour in topology.areas[index]:
+        value = cells[neighbour] * player
+        if value < 0:  # Opponent's cell
+            enemy_gems -= value
+        elif value > 0:  # Adjacent ally cells
+            strategic_value += 1  # Encourage clustering for defense
+        else:  # Neutral cells
+            strategic_value += 0.5  # Potential for expansion
+    # Adjust the multiplier based on game strategy
+    capture_potential = enemy_gems * 0.5
+
+    # Summing up the individual scores for the final cell score
+    return overflow_potential + capture_potential + strategic_value
+
+
+# Keeps the evaluation of a position up to date as moves are played, instead of scoring every
+# occupied cell again at each leaf. Each cell's contribution (its score_cell value) is cached
+# together with the side it counts for, alongside the running point totals of both sides.
+# After a move only the cells whose 3x3 neighbourhood contains a changed cell are rescored.
+#
+# score() is identical to evaluate_board(board, player). Cell scores are multiples of 0.25 for
+# every board size (see Topology.exact_scores), so the running totals are exact whatever order
+# they are updated in; should that ever not hold, the totals are summed again in row-major
+# order as evaluate_board does.
+class IncrementalEvaluator:
+    def __init__(self, board, player):
+        self.player = player
+        self.topology = board.topology
+        self.win_score = board.size * 20
+        cells = board.cells
+        # The side each cell counts for (1 for the player, -1 for the opponent, 0 if empty)
+        # and its contribution to that side's points
+        self.sides = [0] * board.size
+        self.contributions = [0] * board.size
+        self.player_points, self.opponent_points = 0, 0
+        for index in board.occupied_cells():
+            side = 1 if cells[index] * player > 0 else -1
+            contribution = score_cell(cells, self.topology, player, index)
+            self.sides[index] = side
+            self.contributions[index] = contribution
+            if side == 1:
+                self.player_points += contribution
+            else:
+                self.opponent_points += contribution
+
+    """
+    Return the evaluator of a position reached from this one
+    Parameters:
+        board (Grid): The new position.
+        changed (iterable): Flat indices of every cell that differs from this position.
+        leaf (bool): If True, only the point totals are updated and the cell cache is shared
+            with this evaluator, which is enough to call score() on a search leaf.
+    Runtime: O(k) rescoring for the k cells near a change, plus O(n) to copy the cache
+    """
+
+    def child(self, board, changed, leaf=False):
+        new_evaluator = IncrementalEvaluator.__new__(IncrementalEvaluator)
+        new_evaluator.player = self.player
+        new_evaluator.topology = self.topology
+        new_evaluator.win_score = self.win_score
+        if leaf:
+            new_evaluator.sides = self.sides
+            new_evaluator.contributions = self.contributions
+            new_evaluator.player_points, new_evaluator.opponent_points = self.rescore(
+                board, changed, None, None)
+        else:
+            new_evaluator.sides = self.sides[:]
+            new_evaluator.contributions = self.contributions[:]
+            new_evaluator.player_points, new_evaluator.opponent_points = self.rescore(
+                board, changed, new_evaluator.sides, new_evaluator.contributions)
+        return new_evaluator
+
+    """
+    Return the score of this position, as evaluate_board would
+    Runtime: O(1)
+    """
+
+    def score(self):
+        return self.final_score(self.player_points, self.opponent_points)
+
+    # Rescore the cells around the changed ones and return the updated point totals. The new
+    # contributions are written to sides and contributions when they are given.
+    def rescore(self, board, changed, sides, contributions):
+        cells = board.cells
+        topology = self.topology
+        player = self.player
+        areas = topology.areas
+        affected = set()
+        for index in changed:
+            affected.update(areas[index])
+
+        player_points, opponent_points = self.player_points, self.opponent_points
+        old_sides = self.sides
+        old_contributions = self.contributions
+        for index in affected:
+            # Take the old contribution out of its side's points ...
+            if old_sides[index] == 1:
+                player_points -= old_contributions[index]
+            elif old_sides[index] == -1:
+                opponent_points -= old_contributions[index]
+            # ... and add the new one to the side the cell counts for now
+            cell = cells[index]
+            side, contribution = 0, 0
+            if cell != 0:
+                contribution = score_cell(cells, topology, player, index)
+                if cell * player > 0:
+                    side = 1
+                    player_points += contribution
+                else:
+                    side = -1
+                    opponent_points += contribution
+            if sides is not None:
+                sides[index] = side
+                contributions[index] = contribution
+
+        if not topology.exact_scores:
+            player_points, opponent_points = self.ordered_totals(
+                cells, affected, sides, contributions)
+        return player_points, opponent_points
+
+    # Sum the points in row-major order, as evaluate_board does
+    def ordered_totals(self, cells, affected, sides, contributions):
+        player_points, opponent_points = 0, 0
+        for index, cell in enumerate(cells):
+            if cell == 0:
+                continue
+            if contributions is not None:
+                contribution = contributions[index]
+            elif index in affected:
+                contribution = score_cell(
+                    cells, self.topology, self.player, index)
+            else:
+                contribution = self.contributions[index]
+            if cell * self.player > 0:
+                player_points += contribution
+            else:
+                opponent_points += contribution
+        return player_points, opponent_points
+
+    def final_score(self, player_points, opponent_points):
+        if player_points == 0:
+            return -self.win_score
+        elif opponent_points == 0:
+            return self.win_score
+        else:
+            return abs(player_points) - abs(opponent_points)
@@ -1,198 +1,439 @@
-from Overflow import overflow
-
-
-def copy_board(board):
-    current_board = []
-    height = len(board)
-    for i in range(height):
-        current_board.append(board[i].copy())
-    return current_board
-
-
-def evaluate_board(board, player):
-    height = len(board)
-    width = len(board[0])
-    win_score = len(board) * len(board[0]) * 20
-    player_points, opponent_points = 0, 0
-
-    if player == 1:
-        for row_index in range(height):
-            for col_index in range(width):
-                cell = board[row_index][col_index]
-
-                if cell > 0:
-                    player_points += cell_score(board,
-                                                player, row_index, col_index)
-                elif cell < 0:
-                    opponent_points += cell_score(board,
-                                                  player, row_index, col_index)
-
-        if player_points == 0:
-            return -win_score
-        elif opponent_points == 0:
-            return win_score
-        else:
-            return player_points - abs(opponent_points)
-
-    elif player == -1:
-        for row_index in range(height):
-            for col_index in range(width):
-                cell = board[row_index][col_index]
-
-                if cell < 0:
-                    player_points += cell_score(board,
-                                                player, row_index, col_index)
-                elif cell > 0:
-                    opponent_points += cell_score(board,
-                                                  player, row_index, col_index)
-
-        if player_points == 0:
-            return -win_score
-        elif opponent_points == 0:
-            return win_score
-        else:
-            return abs(player_points) - opponent_points
-
+import math
+import time
 
-def cell_score(board, player, row, col):
-    height, width = len(board), len(board[0])
-    cell_value = board[row][col]
+from Overflow import overflow
+from BatchOverflow import BATCH_AVAILABLE, score_moves
+from Grid import Grid
+from Evaluation import IncrementalEvaluator, evaluate_board
+from MoveOrdering import MoveOrderer
+from Symmetry import unique_moves
+from TranspositionTable import EXACT, LOWER, UPPER, canonical_position_key, position_key
 
-    def get_position_score(row, col):
-        # Enhanced positional scoring
-        if (row in [0, height-1] and col in [0, width-1]):
-            return 5  # Corners are more valuable
-        elif row in [0, height-1] or col in [0, width-1]:
-            return 3  # Edges have intermediate value
-        else:
-            return 1  # Center cells
-
-    def calculate_overflow_potential(row, col, position_score):
-        neighbors = 4 - (row in [0, height-1]) - (col in [0, width-1])
-        overflow_potential = (
-            abs(cell_value) / max(1, neighbors)) * position_score
-        return overflow_potential
-
-    def calculate_capture_potential(board, player, row, col):
-        enemy_gems = 0
-        for i in range(-1, 2):
-            for j in range(-1, 2):
-                if 0 <= row+i < len(board) and 0 <= col+j < len(board[0]):
-                    if (board[row+i][col+j] * player < 0):  # Opponent's cell
-                        enemy_gems += abs(board[row+i][col+j])
-        # Adjust the multiplier based on game strategy
-        capture_potential = enemy_gems * 0.5
-        return capture_potential
-
-    def calculate_strategic_value(board, player, row, col):
-        # Example: Increase value for cells that block opponent's progress
-        strategic_value = 0
-        for i in range(-1, 2):
-            for j in range(-1, 2):
-                if 0 <= row+i < len(board) and 0 <= col+j < len(board[0]):
-                    if board[row+i][col+j] * player > 0:  # Adjacent ally cells
-                        strategic_value += 1  # Encourage clustering for defense
-                    elif board[row+i][col+j] == 0:  # Neutral cells
-                        strategic_value += 0.5  # Potential for expansion
-        return strategic_value
-
-    position_score = get_position_score(row, col)
-    overflow_potential = calculate_overflow_potential(
-        row, col, position_score)
-    capture_potential = calculate_capture_potential(
-        board, player, row, col)
-    strategic_value = calculate_strategic_value(board, player, row, col)
-
-    # Summing up the individual scores for the final cell score
-    return overflow_potential + capture_potential + strategic_value
+# Deepest tree iterative deepening will try
+MAX_TREE_HEIGHT = 12
+# Positions visited between looks at the clock and the stop event
+CHECK_INTERVAL = 64
 
 
+def copy_board(board):
+    return board.clone()
+
+
+"""
+Lists the legal moves of a player as flat cell indices in row-major order: every empty cell
+and every cell the player already owns. The board keeps them as a bitset, so only the legal
+cells are visited.
+"""
+
+
+def generate_moves(board, player):
+    return board.legal_moves(player)
+
+
+"""
+Returns a new board with one gem of the player added at the flat index and the resulting
+overflow played out. The original board is left untouched. If a changed set is given, the flat
+index of every cell the move may have changed is added to it, and if a SearchStats is given the
+overflow waves are counted in it. With an OverflowMemo, a move played on the same position
+before is taken from the memo instead of being played out again.
+"""
+
+
+def make_move(board, index, player, changed=None, stats=None, memo=None):
+    if memo is not None:
+        new_board, waves, memo_changed = memo.play(board, index, player)
+        if changed is not None:
+            changed.update(memo_changed)
+    else:
+        new_board = copy_board(board)
+        new_board.add(index, player)
+        if changed is not None:
+            changed.add(index)
+        # Only the cell just played on and the cells left overflowing can start a cascade
+        waves = overflow(new_board, changed=changed, start=board.overflow_start(index))
+    if stats is not None:
+        stats.moves += 1
+        stats.waves += waves
+    return new_board
+
+
+# Raised inside a search that ran past its deadline
+class SearchTimeout(Exception):
+    pass
+
+
+# Raised inside a search whose stop event was set
+class SearchCancelled(Exception):
+    pass
+
+
+# Depth-first alpha-beta search. Children are generated on demand inside the recursion, so only
+# the boards on the current path are alive at any time and the moves that alpha-beta prunes are
+# never simulated. A tree of height h searches h - 1 plies, as the fully built tree used to.
+#
+# With a TranspositionTable, positions reached again through another move order are answered
+# from the table. Stored scores are only reused for the same remaining depth, so the search
+# returns exactly what it would without the table.
+#
+# pv is a principal variation (flat move indices from the root) to search first. A MoveOrderer
+# adds table moves, killer moves, history scores and overflow hints to the move ordering.
+# Whatever the move order, the chosen move is the first best root move in row-major order, as
+# with a plain search.
+#
+# deadline is a time.monotonic() value after which the search raises SearchTimeout, and setting
+# the stop event (a threading.Event) from another thread makes it raise SearchCancelled.
+#
+# Leaves are scored with an IncrementalEvaluator carried down the current path, which only
+# rescores the cells near each move's changes; incremental=False scores every leaf from scratch
+# with evaluate_board. Both give the same scores.
+#
+# With a SearchStats object the search also counts leaves, cutoffs per ply, overflow waves and
+# table hits in it (see SearchStats).
+#
+# With an OverflowMemo, moves the search has played on a position before (in this search or an
+# earlier one sharing the memo) are not played out again.
+#
+# With batch=True and NumPy installed, the nodes just above the leaves play and score all their
+# moves in one vectorised batch (see BatchOverflow) instead of one child at a time. The scores
+# are the same, so is the search; it only saves time where the boards are big enough for NumPy
+# to beat the scalar code.
 class GameTree:
-    class Node:
-        def __init__(self, board, depth, player, tree_height=4):
-            self.board = board
-            self.depth = depth
-            self.player = player
-            self.tree_height = tree_height
-            self.children = []
-            self.board_eval = None
-            self.move = None
-
-        def create_child(self):
-            if self.depth == self.tree_height - 1:
-                return
-
-            possible_moves = []
-            for row in range(len(self.board)):
-                for col in range(len(self.board[0])):
-                    if self.board[row][col] == 0 or self.board[row][col] * self.player > 0:
-                        possible_moves.append((row, col))
-
-            for move in possible_moves:
-                new_board = copy_board(self.board)
-                new_board[move[0]][move[1]] += self.player
-                overflow(new_board)
-                new_node = GameTree.Node(
-                    new_board, self.depth + 1, -self.player, self.tree_height)
-                new_node.move = move
-                self.children.append(new_node)
-
-    def __init__(self, board, player, tree_height=4):
+    def __init__(self, board, player, tree_height=4, table=None, pv=None, deadline=None,
+                 orderer=None, incremental=True, stop=None, search=True, stats=None,
+                 batch=False, memo=None):
         self.player = player
+        self.memo = memo
+        self.stats = stats
+        self.batch = batch and BATCH_AVAILABLE
         self.height = tree_height
-        self.board = copy_board(board)
-        self.root = self.Node(self.board, 0, self.player, self.height)
-        self.create_tree(self.root)
-        self.minimax(self.root)
-
-    def create_tree(self, node):
-        node.create_child()
-        for child in node.children:
-            self.create_tree(child)
-
-    def minimax(self, node, a=float('-inf'), b=float('inf')):
-        if not node.children:
-            node.board_eval = evaluate_board(node.board, self.player)
-
-            return node.board_eval
-
-        if node.player == self.player:
+        self.table = table
+        self.incremental = incremental
+        self.pv_seed = pv or []
+        self.deadline = deadline
+        self.stop = stop
+        self.orderer = orderer
+        # Positions visited, leaves included, and the count at which the clock is next checked
+        self.nodes = 0
+        self.next_check = CHECK_INTERVAL
+        # Accept both Grid boards and plain lists of lists
+        self.board = copy_board(board) if isinstance(
+            board, Grid) else Grid.from_lists(board)
+        # (move, evaluation) of every root move, in the order they were searched
+        self.root_moves = []
+        self.best_move = None
+        # pv_lines[depth] is the best line found below the node currently searched at depth
+        self.pv_lines = [[] for _ in range(max(1, tree_height))]
+        self.pv = []
+        # With search=False the tree is only set up, for callers that search single root moves
+        # with search_move()
+        self.board_eval = self.search_root() if search else None
+
+    def search_root(self):
+        if self.height <= 1:
+            return evaluate_board(self.board, self.player)
+        moves = generate_moves(self.board, self.player)
+        if not moves:
+            return evaluate_board(self.board, self.player)
+        if self.stats is not None:
+            self.stats.expanded += 1
+        # Moves symmetric to an earlier move lead to equally good positions
+        moves = unique_moves(self.board, moves)
+        table_move = None
+        if self.table is not None:
+            key, symmetry = self.table_key(self.board, self.player)
+            entry = self.table.probe(key, self.height - 1)
+            table_move = self.from_table(entry, symmetry)
+        moves = self.order_moves(
+            self.board, moves, self.player, 0, True, table_move)
+
+        evaluator = IncrementalEvaluator(
+            self.board, self.player) if self.incremental else None
+        a = float('-inf')
+        max_eval = float('-inf')
+        best_index = None
+        for index in moves:
+            evaluation = self.search_move(
+                index, root_alpha(a, best_index, index), evaluator)
+            self.root_moves.append(
+                (divmod(index, self.board.width), evaluation))
+            if evaluation > max_eval or (evaluation == max_eval and index < best_index):
+                max_eval = evaluation
+                best_index = index
+                self.pv = [index] + self.pv_lines[1]
+            a = max(a, evaluation)
+        self.best_move = divmod(best_index, self.board.width)
+        if self.table is not None:
+            self.table.store(key, self.height - 1, max_eval, EXACT,
+                             best_index if symmetry is None else symmetry[best_index])
+        return max_eval
+
+    # Search one root move with the window (a, inf) and return its evaluation
+    def search_move(self, index, a=float('-inf'), evaluator=None):
+        if evaluator is None and self.incremental:
+            evaluator = IncrementalEvaluator(self.board, self.player)
+        child, child_evaluator = self.play(
+            self.board, index, self.player, 0, evaluator)
+        return self.minimax(child, 1, -self.player, a, float('inf'),
+                            self.follows_pv(0, True, index), child_evaluator)
+
+    def minimax(self, board, depth, player, a=float('-inf'), b=float('inf'), on_pv=False,
+                evaluator=None):
+        self.pv_lines[depth] = []
+        self.nodes += 1
+        stats = self.stats
+        if stats is not None:
+            stats.nodes += 1
+        if depth == self.height - 1:
+            return self.evaluate(board, evaluator)
+
+        # Only look at the clock and the stop event every so often. Counting from the last check
+        # keeps the checks regular on big boards, where most visited positions are leaves and
+        # do not come through here.
+        if self.nodes >= self.next_check:
+            self.next_check = self.nodes + CHECK_INTERVAL
+            if self.stop is not None and self.stop.is_set():
+                raise SearchCancelled()
+            if self.deadline is not None and time.monotonic() >= self.deadline:
+                raise SearchTimeout()
+
+        remaining = self.height - 1 - depth
+        table = self.table
+        table_move = None
+        if table is not None:
+            key, symmetry = self.table_key(board, player)
+            entry = table.probe(key, remaining)
+            if stats is not None:
+                stats.table_probes += 1
+                stats.table_hits += entry is not None
+            if entry is not None:
+                table_move = self.from_table(entry, symmetry)
+                if entry[1] == remaining:
+                    score, bound = entry[2], entry[3]
+                    if bound == EXACT or (bound == LOWER and score >= b) or (bound == UPPER and score <= a):
+                        return score
+            a_start, b_start = a, b
+
+        moves = generate_moves(board, player)
+        if not moves:
+            return self.evaluate(board, evaluator)
+        if stats is not None:
+            stats.expanded += 1
+        moves = self.order_moves(
+            board, moves, player, depth, on_pv, table_move)
+        # The scores of all children at once when they are leaves and batching is on
+        scores = score_moves(board, moves, player, self.player, stats) if (
+            self.batch and depth + 2 == self.height) else None
+
+        best_index = None
+        if player == self.player:
             max_eval = float('-inf')
-            for child in node.children:
-                evaluation = self.minimax(child, a, b)
-                max_eval = max(max_eval, evaluation)
+            for position, index in enumerate(moves):
+                if scores is not None:
+                    evaluation = self.batch_leaf(depth + 1, scores[position])
+                else:
+                    child, child_evaluator = self.play(
+                        board, index, player, depth, evaluator)
+                    evaluation = self.minimax(child, depth + 1, -player, a, b,
+                                              self.follows_pv(depth, on_pv, index), child_evaluator)
+                if evaluation > max_eval:
+                    max_eval = evaluation
+                    best_index = index
+                    self.pv_lines[depth] = [index] + self.pv_lines[depth + 1]
                 a = max(a, evaluation)
                 if b <= a:
+                    self.record_cutoff(player, index, depth,
+                                       remaining, index == moves[0])
                     break
-            node.board_eval = max_eval
-            return max_eval
+            best_eval = max_eval
         else:
             min_eval = float('inf')
-            for child in node.children:
-                evaluation = self.minimax(child, a, b)
-                min_eval = min(min_eval, evaluation)
+            for position, index in enumerate(moves):
+                if scores is not None:
+                    evaluation = self.batch_leaf(depth + 1, scores[position])
+                else:
+                    child, child_evaluator = self.play(
+                        board, index, player, depth, evaluator)
+                    evaluation = self.minimax(child, depth + 1, -player, a, b,
+                                              self.follows_pv(depth, on_pv, index), child_evaluator)
+                if evaluation < min_eval:
+                    min_eval = evaluation
+                    best_index = index
+                    self.pv_lines[depth] = [index] + self.pv_lines[depth + 1]
                 b = min(b, evaluation)
                 if b <= a:
+                    self.record_cutoff(player, index, depth,
+                                       remaining, index == moves[0])
                     break
-            node.board_eval = min_eval
-            return min_eval
+            best_eval = min_eval
+
+        if table is not None:
+            # A score outside the original window is only a bound on the real score
+            if best_eval <= a_start:
+                bound = UPPER
+            elif best_eval >= b_start:
+                bound = LOWER
+            else:
+                bound = EXACT
+            if symmetry is not None:
+                best_index = symmetry[best_index]
+            table.store(key, remaining, best_eval, bound, best_index)
+        return best_eval
+
+    # Return the table key of a position and, for a symmetric table, the permutation that maps
+    # moves to and from the table's frame (None otherwise)
+    def table_key(self, board, player):
+        if self.table.symmetric:
+            return canonical_position_key(board, player, self.player)
+        return position_key(board, player, self.player), None
+
+    # Return the best move of a table entry in the position's own frame, or None
+    def from_table(self, entry, symmetry):
+        if entry is None or entry[4] is None or symmetry is None:
+            return entry[4] if entry is not None else None
+        return symmetry[entry[4]]
+
+    # Visit a leaf whose score came from a batch, counting it as minimax() counts a leaf
+    def batch_leaf(self, depth, score):
+        self.pv_lines[depth] = []
+        self.nodes += 1
+        if self.stats is not None:
+            self.stats.nodes += 1
+            self.stats.leaves += 1
+        return score
+
+    # Play a move from a node at the given depth, and bring the evaluator along when there is one
+    def play(self, board, index, player, depth, evaluator):
+        if evaluator is None:
+            return make_move(board, index, player, stats=self.stats, memo=self.memo), None
+        changed = set()
+        child = make_move(board, index, player, changed, self.stats, self.memo)
+        return child, evaluator.child(child, changed, depth + 1 == self.height - 1)
+
+    def evaluate(self, board, evaluator):
+        if self.stats is not None:
+            self.stats.leaves += 1
+        if evaluator is not None:
+            return evaluator.score()
+        return evaluate_board(board, self.player)
+
+    # Put the principal variation move first at a node that lies on the seeded variation, and
+    # let the move orderer (if any) sort the rest
+    def order_moves(self, board, moves, player, depth, on_pv, table_move):
+        pv_move = self.pv_seed[depth] if on_pv and depth < len(
+            self.pv_seed) else None
+        if self.orderer is not None:
+            return self.orderer.order(board, moves, player, depth, pv_move, table_move)
+        if pv_move in moves:
+            moves.remove(pv_move)
+            moves.insert(0, pv_move)
+        return moves
+
+    def record_cutoff(self, player, index, depth, remaining, first):
+        if self.stats is not None:
+            self.stats.record_cutoff(depth)
+        if self.orderer is not None:
+            self.orderer.record_cutoff(
+                player, index, depth, remaining, first)
+
+    def follows_pv(self, depth, on_pv, index):
+        return on_pv and depth < len(self.pv_seed) and self.pv_seed[depth] == index
 
     def get_move(self):
-        if self.root.board_eval is None:
-            self.minimax(self.root, self.player)
-
-        best_move = None
-        best_value = float('-inf')
-        for child in self.root.children:
-            if child.board_eval > best_value:
-                best_value = child.board_eval
-                best_move = child.move
-        return best_move
-
-    def clear_tree(self):
-        self.clear_tree_r(self.root)
-
-    def clear_tree_r(self, node):
-        for child in node.children:
-            self.clear_tree_r(child)
-        node.children = []
+        return self.best_move
+
+
+"""
+Returns the alpha to search a root move with, given the best root score and move so far. A
+move that comes before the current best in row-major order wins ties, so it is searched with a
+window just below the best score to get its exact value. Any move searched this way whose
+evaluation beats the best so far (or ties it from a lower index) is exact.
+"""
+
+
+def root_alpha(best_value, best_index, index):
+    if best_index is None or index > best_index:
+        return best_value
+    return math.nextafter(best_value, float('-inf'))
+
+
+"""
+Searches with iterative deepening until a time budget runs out. Each iteration searches one ply
+deeper than the last, seeded with the previous iteration's principal variation, and the tree of
+the deepest completed iteration is returned. The first iteration always completes, so a move is
+found however small the budget.
+
+Parameters:
+    board (Grid): The position to search.
+    player (int): The player to move (1 or -1).
+    time_budget (float): Seconds available for the search.
+    table (TranspositionTable): Optional table shared by the iterations.
+    max_height (int): The deepest tree height to try.
+    orderer (MoveOrderer): Optional move orderer shared by the iterations.
+    stop (threading.Event): Optional event that cancels the search with SearchCancelled.
+    pv (list): Optional principal variation to seed the first iteration with.
+    stats (SearchStats): Optional statistics to collect, including every iteration's time.
+    memo (OverflowMemo): Optional memo of played moves shared by the iterations.
+
+Returns:
+    GameTree: The deepest completed search.
+"""
+
+
+def iterative_deepening(board, player, time_budget, table=None, max_height=MAX_TREE_HEIGHT,
+                        orderer=None, stop=None, pv=None, stats=None, memo=None):
+    deadline = time.monotonic() + time_budget
+    if orderer is not None:
+        orderer.age()
+    best_tree = None
+    pv = pv or []
+    for height in range(2, max_height + 1):
+        start = time.monotonic()
+        try:
+            tree = GameTree(board, player, height, table, pv,
+                            deadline if best_tree is not None else None, orderer, stop=stop,
+                            stats=stats, memo=memo)
+        except SearchTimeout:
+            break
+        if stats is not None:
+            stats.record_iteration(height, time.monotonic() - start, tree.nodes)
+        best_tree = tree
+        # Seed the next iteration with this one's variation, unless it only confirms the start
+        # of a longer seed
+        if pv[:len(tree.pv)] != tree.pv:
+            pv = tree.pv
+        # Stop when there is no choice to make or no time left for a deeper iteration
+        if len(tree.root_moves) <= 1 or time.monotonic() >= deadline:
+            break
+    return best_tree
+
+
+"""
+Searches with iterative deepening until a time budget runs out (see iterative_deepening) and
+returns the (row, col) of the chosen move, or None if the player has no move.
+"""
+
+
+def search_with_budget(board, player, time_budget, table=None, max_height=MAX_TREE_HEIGHT,
+                       orderer=None, stop=None, pv=None):
+    return iterative_deepening(board, player, time_budget, table, max_height, orderer, stop,
+                               pv).get_move()
+
+
+"""
+Measures what the move ordering heuristics save by searching the same position once in plain
+row-major order and once with a MoveOrderer.
+
+Parameters:
+    board (Grid): The position to search.
+    player (int): The player to move (1 or -1).
+    tree_height (int): The height of the search tree.
+
+Returns:
+    int: The number of nodes the ordered search visited fewer than the plain one.
+"""
+
+
+def ordering_savings(board, player, tree_height=4):
+    plain = GameTree(board, player, tree_height)
+    ordered = GameTree(board, player, tree_height, orderer=MoveOrderer())
+    return plain.nodes - ordered.nodes
@@ -0,0 +1,360 @@
+from array import array
+from itertools import compress
+
+from Topology import get_topology
+
+# Turns the characters of a binary number into the bit values 0 and 1
+BIT_VALUES = bytes.maketrans(b"01", b"\x00\x01")
+
+
+# Compact board shared by the overflow engine, the bots and the GUI.
+# Cells are stored row-major in a flat array of signed bytes: positive values are player 1's
+# gems, negative values are player 2's gems and 0 is an empty cell. Every grid of a given size
+# shares one Topology holding the neighbour and scoring tables for that size.
+#
+# The Zobrist key of a grid is only tracked once zobrist_key() has been called; from then on
+# set(), add() and overflow() keep it up to date incrementally and clone() carries it over.
+# Code that writes to cells directly must not be used on a grid that tracks its key.
+#
+# Every grid also keeps, for each player, how many cells they occupy and how many gems they have
+# on the board. set(), add() and overflow() update the counts as cells change, so win and score
+# queries never scan the cells. Code that writes to cells directly has to call recount() after.
+#
+# The legal moves of each player (every empty cell and every cell they own) are kept the same way,
+# as bitsets with bit i standing for the cell at flat index i. The same bitsets give the occupied
+# cells, so code that only cares about the gems on a big, mostly empty board never visits the
+# empty cells.
+#
+# max_waves caps how many waves one overflow may take (None for no cap). Big boards can set it so
+# that a single move's cascade stays bounded; it is part of the rules of the game played on the
+# grid, so clone() and pickling carry it over.
+#
+# A capped overflow can stop with cells still overflowing. overflow() records them in pending, so
+# the next move's overflow starts from those cells and the one played on instead of scanning the
+# whole grid (see overflow_start). pending is None when it is not known which cells overflow: on a
+# capped grid built from given cells or after recount(). An uncapped overflow always runs until
+# no cell overflows, so an uncapped grid starts out with no pending cells.
+class Grid:
+    __slots__ = ("height", "width", "size", "cells", "topology", "zobrist",
+                 "positive_cells", "negative_cells", "positive_gems", "negative_gems",
+                 "positive_moves", "negative_moves", "max_waves", "pending")
+
+    """
+    Create a grid of the given size. If cells is None every cell starts empty, otherwise the
+    row-major cell values are copied from cells.
+    """
+
+    def __init__(self, height, width, cells=None, max_waves=None):
+        self.height = height
+        self.width = width
+        self.size = height * width
+        self.topology = get_topology(height, width)
+        self.zobrist = None
+        if max_waves is not None and max_waves < 1:
+            # Without a wave no cell ever overflows, and cells would grow past what they can hold
+            raise ValueError("Grid() max_waves must be at least 1, got {}".format(max_waves))
+        self.max_waves = max_waves
+        if cells is None:
+            self.cells = array("b", bytes(self.size))
+        else:
+            self.cells = array("b", cells)
+            if len(self.cells) != self.size:
+                raise ValueError("Grid() expected {} cells, got {}".format(
+                    self.size, len(self.cells)))
+        self.recount()
+        if cells is None:
+            # An empty grid has nothing to overflow
+            self.pending = ()
+
+    """
+    Build a grid from a list of lists of ints
+    Runtime: O(n) where n is the number of cells
+    """
+
+    @classmethod
+    def from_lists(cls, rows):
+        return cls(len(rows), len(rows[0]), [cell for row in rows for cell in row])
+
+    """
+    Return the grid as a new list of lists of ints
+    Runtime: O(n) where n is the number of cells
+    """
+
+    def to_lists(self):
+        width = self.width
+        return [self.cells[row * width:(row + 1) * width].tolist() for row in range(self.height)]
+
+    """
+    Return an independent copy of the grid. Copying the flat array is a single memory copy.
+    Runtime: O(n) where n is the number of cells
+    """
+
+    def clone(self):
+        new_grid = Grid.__new__(Grid)
+        new_grid.height = self.height
+        new_grid.width = self.width
+        new_grid.size = self.size
+        new_grid.cells = self.cells[:]
+        new_grid.topology = self.topology
+        new_grid.zobrist = self.zobrist
+        new_grid.positive_cells = self.positive_cells
+        new_grid.negative_cells = self.negative_cells
+        new_grid.positive_gems = self.positive_gems
+        new_grid.negative_gems = self.negative_gems
+        new_grid.positive_moves = self.positive_moves
+        new_grid.negative_moves = self.negative_moves
+        new_grid.max_waves = self.max_waves
+        new_grid.pending = self.pending
+        return new_grid
+
+    """
+    Return the flat index of the cell at (row, col)
+    Runtime: O(1)
+    """
+
+    def index(self, row, col):
+        return row * self.width + col
+
+    """
+    Return the value of the cell at (row, col)
+    Runtime: O(1)
+    """
+
+    def get(self, row, col):
+        return self.cells[row * self.width + col]
+
+    """
+    Set the value of the cell at (row, col)
+    Runtime: O(1)
+    """
+
+    def set(self, row, col, value):
+        index = row * self.width + col
+        old = self.cells[index]
+        if self.zobrist is not None:
+            self.update_zobrist(index, old, value)
+        self.update_counts(old, value)
+        self.update_moves(index, value)
+        self.cells[index] = value
+
+    """
+    Add amount to the cell at the flat index
+    Runtime: O(1)
+    """
+
+    def add(self, index, amount):
+        old = self.cells[index]
+        value = old + amount
+        if self.zobrist is not None:
+            self.update_zobrist(index, old, value)
+        self.update_counts(old, value)
+        self.update_moves(index, value)
+        self.cells[index] = value
+
+    """
+    Update the per-player counts for a cell changing from old to new
+    Runtime: O(1)
+    """
+
+    def update_counts(self, old, new):
+        if old > 0:
+            self.positive_cells -= 1
+            self.positive_gems -= old
+        elif old < 0:
+            self.negative_cells -= 1
+            self.negative_gems += old
+        if new > 0:
+            self.positive_cells += 1
+            self.positive_gems += new
+        elif new < 0:
+            self.negative_cells += 1
+            self.negative_gems -= new
+
+    """
+    Update the legal move bitsets for the cell at the flat index taking the given value
+    Runtime: O(1)
+    """
+
+    def update_moves(self, index, value):
+        bit = 1 << index
+        if value > 0:
+            self.positive_moves |= bit
+            self.negative_moves &= ~bit
+        elif value < 0:
+            self.positive_moves &= ~bit
+            self.negative_moves |= bit
+        else:
+            self.positive_moves |= bit
+            self.negative_moves |= bit
+
+    """
+    Count the cells and gems of each player and rebuild their legal move bitsets from scratch.
+    On a capped grid the overflowing cells are no longer known afterwards.
+    Runtime: O(n) where n is the number of cells
+    """
+
+    def recount(self):
+        self.pending = () if self.max_waves is None else None
+        self.positive_cells, self.negative_cells = 0, 0
+        self.positive_gems, self.negative_gems = 0, 0
+        positive_moves, negative_moves = 0, 0
+        for index, cell in enumerate(self.cells):
+            if cell > 0:
+                self.positive_cells += 1
+                self.positive_gems += cell
+                positive_moves |= 1 << index
+            elif cell < 0:
+                self.negative_cells += 1
+                self.negative_gems -= cell
+                negative_moves |= 1 << index
+            else:
+                positive_moves |= 1 << index
+                negative_moves |= 1 << index
+        self.positive_moves, self.negative_moves = positive_moves, negative_moves
+
+    """
+    Return how many cells the player occupies
+    Runtime: O(1)
+    """
+
+    def cell_count(self, player):
+        return self.positive_cells if player == 1 else self.negative_cells
+
+    """
+    Return how many gems the player has on the board
+    Runtime: O(1)
+    """
+
+    def gem_count(self, player):
+        return self.positive_gems if player == 1 else self.negative_gems
+
+    """
+    Return whether the player may play at the flat index (an empty cell or one of their own)
+    Runtime: O(1)
+    """
+
+    def is_legal(self, index, player):
+        moves = self.positive_moves if player == 1 else self.negative_moves
+        return (moves >> index) & 1 == 1
+
+    """
+    Return the player's legal moves as flat indices in row-major order
+    Runtime: O(n / w + m) where w is the machine word size in bits and m the number of legal
+    moves
+    """
+
+    def legal_moves(self, player):
+        return bit_indices(self.positive_moves if player == 1 else self.negative_moves)
+
+    """
+    Return the flat indices of the occupied cells in row-major order
+    Runtime: O(n / w + m) where w is the machine word size in bits and m the number of occupied
+    cells
+    """
+
+    def occupied_cells(self):
+        # Empty cells are the ones both players may play on
+        return bit_indices(((1 << self.size) - 1) ^ (self.positive_moves & self.negative_moves))
+
+    """
+    Return whether no cell of the grid can be overflowing. That holds once both players are on
+    the board and no cells are pending: the last overflow then ran until no cell overflowed, so a
+    move can only set off a cascade from the cell it is played on.
+    Runtime: O(1)
+    """
+
+    def is_settled(self):
+        return self.pending == () and self.positive_cells > 0 and self.negative_cells > 0
+
+    """
+    Return the flat indices of the only cells that can overflow in the first wave after a move at
+    the flat index (the start argument of overflow()): the cell played on and the pending cells.
+    Return None if the whole grid has to be checked, when the pending cells are not known or a
+    player has no cells.
+    Runtime: O(p) where p is the number of pending cells
+    """
+
+    def overflow_start(self, index):
+        pending = self.pending
+        if pending is None or self.positive_cells == 0 or self.negative_cells == 0:
+            return None
+        if not pending:
+            return (index,)
+        return pending if index in pending else pending + (index,)
+
+    """
+    Return the player who has won the board, or 0 if both players still have gems on it
+    Runtime: O(1)
+    """
+
+    def winner(self):
+        if self.negative_cells == 0:
+            return 1 if self.positive_cells else 0
+        if self.positive_cells == 0:
+            return -1
+        return 0
+
+    """
+    Return the 64-bit Zobrist key of the position, computing it on the first call and tracking
+    it incrementally afterwards
+    Runtime: O(n) on the first call, O(1) afterwards
+    """
+
+    def zobrist_key(self):
+        if self.zobrist is None:
+            table = self.topology.zobrist_table()
+            values = self.topology.zobrist_values
+            key = 0
+            for index, cell in enumerate(self.cells):
+                key ^= table[index][cell % values]
+            self.zobrist = key
+        return self.zobrist
+
+    """
+    Update the tracked Zobrist key for the cell at the flat index changing from old to new
+    Runtime: O(1)
+    """
+
+    def update_zobrist(self, index, old, new):
+        keys = self.topology.zobrist[index]
+        values = self.topology.zobrist_values
+        self.zobrist ^= keys[old % values] ^ keys[new % values]
+
+    """
+    Return the raw cell bytes, usable as a dictionary key for the current position
+    Runtime: O(n) where n is the number of cells
+    """
+
+    def key(self):
+        return self.cells.tobytes()
+
+    # Grids compare and hash by size and content. The hash follows the content, so a grid must
+    # not be mutated while it is being used as a dictionary key.
+    def __eq__(self, other):
+        if not isinstance(other, Grid):
+            return NotImplemented
+        return self.height == other.height and self.width == other.width and self.cells == other.cells
+
+    def __hash__(self):
+        return hash((self.height, self.width, self.cells.tobytes()))
+
+    def __reduce__(self):
+        return (Grid, (self.height, self.width, self.cells, self.max_waves), self.pending)
+
+    def __setstate__(self, pending):
+        self.pending = pending
+
+    def __repr__(self):
+        return "Grid({}, {}, {})".format(self.height, self.width, self.cells.tolist())
+
+
+"""
+Returns the positions of the set bits of a bitset, lowest first.
+"""
+
+
+def bit_indices(mask):
+    # The binary digits lowest first as 0 and 1 bytes, so that byte i is bit i; compress() then
+    # picks out the positions of the ones without a Python loop
+    digits = bin(mask)[:1:-1].encode().translate(BIT_VALUES)
+    return list(compress(range(len(digits)), digits))
@@ -0,0 +1,179 @@
+import math
+import random
+import time
+
+from Overflow import overflow
+from Grid import Grid
+from Evaluation import evaluate_board
+from GameTree import SearchCancelled, generate_moves, make_move
+
+# Exploration constant of the UCT formula
+EXPLORATION = math.sqrt(2)
+# Random playouts that have not ended after this many plies are scored as they stand
+PLAYOUT_LIMIT = 200
+# How often (in iterations) the deadline and the stop event are checked
+CHECK_INTERVAL = 16
+
+
+"""
+Returns the player who has won the board, or 0 if both players still have gems on it. The board
+counts each player's cells, so this is O(1).
+"""
+
+
+def get_winner(board):
+    return board.winner()
+
+
+# A position in the Monte Carlo tree, reached by the previous player playing move.
+# wins and visits count the playout results from the point of view of the player who played
+# move (1 for a win, 0 for a loss, in between for an evaluated leaf).
+class MonteCarloNode:
+    __slots__ = ("board", "player", "move", "parent", "children", "untried", "visits", "wins",
+                 "winner")
+
+    def __init__(self, board, player, move=None, parent=None):
+        self.board = board
+        self.player = player
+        self.move = move
+        self.parent = parent
+        self.children = []
+        self.visits = 0
+        self.wins = 0.0
+        # The root of a fresh game has only one gem per player, so the winner check is only
+        # meaningful below the root
+        self.winner = get_winner(board) if parent is not None else 0
+        # Moves not expanded yet
+        self.untried = [] if self.winner else generate_moves(board, player)
+
+    # Return the child with the best UCT score
+    def select_child(self):
+        log_visits = math.log(self.visits)
+        return max(self.children, key=lambda child: child.wins / child.visits +
+                   EXPLORATION * math.sqrt(log_visits / child.visits))
+
+    # Play an untried move picked at random and return the new child
+    def expand(self, rng):
+        index = self.untried.pop(rng.randrange(len(self.untried)))
+        child = MonteCarloNode(make_move(self.board, index, self.player), -self.player, index,
+                               self)
+        self.children.append(child)
+        return child
+
+
+# Monte Carlo tree search with UCT selection, using the same overflow rules as GameTree.
+# Each iteration walks down the tree by UCT, expands one new position and scores it, either by
+# a random playout on a copy of the compact board or, with evaluate=True, by mapping
+# evaluate_board to a win probability. The result is then backed up to the root.
+#
+# The tree is kept between searches: when the next search is asked for a position two plies
+# below the last root (the engine's move and the opponent's reply), that subtree becomes the
+# new root and its statistics are reused.
+class MonteCarloTree:
+    def __init__(self, player, evaluate=False, seed=None):
+        self.player = player
+        self.evaluate = evaluate
+        self.random = random.Random(seed)
+        self.root = None
+        self.iterations = 0
+        self.reused_visits = 0
+
+    """
+    Choose a move for the board
+    Parameters:
+        board (Grid or list of lists): The position to search, with this engine's player to move.
+        iterations (int): How many iterations to run, or None to run until the time budget ends.
+        time_budget (float): Seconds available for the search, or None.
+        stop (threading.Event): Optional event that cancels the search with SearchCancelled.
+    Return: the (row, col) of the most visited move, or None if the player has no move
+    """
+
+    def search(self, board, iterations=1000, time_budget=None, stop=None):
+        if not isinstance(board, Grid):
+            board = Grid.from_lists(board)
+        if iterations is None and time_budget is None:
+            raise ValueError("MonteCarloTree.search() needs iterations or a time_budget")
+        self.root = self.find_root(board)
+        self.reused_visits = self.root.visits
+        deadline = time.monotonic() + time_budget if time_budget is not None else None
+
+        self.iterations = 0
+        while iterations is None or self.iterations < iterations:
+            if self.iterations % CHECK_INTERVAL == 0:
+                if stop is not None and stop.is_set():
+                    raise SearchCancelled()
+                # Always run at least one iteration so that there is a move to return
+                if deadline is not None and self.iterations and time.monotonic() >= deadline:
+                    break
+            self.iterate()
+            self.iterations += 1
+        return self.get_move()
+
+    # Run one selection, expansion, simulation and backpropagation step
+    def iterate(self):
+        node = self.root
+        while not node.untried and node.children:
+            node = node.select_child()
+        if node.untried:
+            node = node.expand(self.random)
+        result = self.simulate(node)
+        # result is the value for the player who moved into node; it flips at every ply up
+        while node is not None:
+            node.visits += 1
+            node.wins += result
+            result = 1.0 - result
+            node = node.parent
+
+    # Return the value of the node for the player who moved into it
+    def simulate(self, node):
+        mover = -node.player
+        if node.winner:
+            return 1.0 if node.winner == mover else 0.0
+        if self.evaluate:
+            return self.win_probability(node.board, mover)
+
+        # Random playout on a copy of the compact board (without Zobrist tracking)
+        board = node.board.clone()
+        board.zobrist = None
+        player = node.player
+        for _ in range(PLAYOUT_LIMIT):
+            moves = board.legal_moves(player)
+            if not moves:
+                break
+            index = self.random.choice(moves)
+            # Only the cell played on and the cells left overflowing can start a cascade
+            start = board.overflow_start(index)
+            board.add(index, player)
+            overflow(board, start=start)
+            winner = get_winner(board)
+            if winner:
+                return 1.0 if winner == mover else 0.0
+            player = -player
+        return self.win_probability(board, mover)
+
+    # Map evaluate_board to a value between 0 and 1 for the player
+    def win_probability(self, board, player):
+        return 0.5 + 0.5 * math.tanh(evaluate_board(board, player) / board.size)
+
+    # Return the node to search from: the subtree of the last search if the board is two plies
+    # below its root, otherwise a new node
+    def find_root(self, board):
+        if self.root is not None:
+            for child in self.root.children:
+                for grandchild in child.children:
+                    if grandchild.board == board:
+                        grandchild.parent = None
+                        return grandchild
+        return MonteCarloNode(board, self.player)
+
+    """
+    Return the (row, col) of the most visited root move, or None if there is none
+    """
+
+    def get_move(self):
+        if not self.root.children:
+            if not self.root.untried:
+                return None
+            return divmod(self.root.untried[0], self.root.board.width)
+        best = max(self.root.children, key=lambda child: child.visits)
+        return divmod(best.move, self.root.board.width)
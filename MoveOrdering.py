@@ -0,0 +1,98 @@
+# Ordering scores of the move sources; a move takes the score of the best source it comes from,
+# and moves with equal scores keep their row-major order
+PV_SCORE = 1 << 30
+TABLE_SCORE = 1 << 29
+KILLER_SCORES = (1 << 28, 1 << 27)
+OVERFLOW_HINT_SCORE = 1 << 26
+
+
+# Orders the moves of a search node so that alpha-beta finds its cutoffs early.
+# Moves are tried in this order: the principal variation move, the transposition table's best
+# move, the two killer moves of the ply (moves that caused a cutoff at the same ply elsewhere
+# in the tree), moves onto an own cell one gem away from overflowing, and then the rest by
+# their history score (how often and how deep each (player, cell) has caused cutoffs).
+class MoveOrderer:
+    def __init__(self):
+        self.killers = []
+        self.history = {}
+        # Cutoffs seen, and how many of them came from the first move tried at the node
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    """
+    Return the moves sorted best-first
+    Parameters:
+        board (Grid): The position the moves are played on.
+        moves (list): Flat indices of the legal moves, in row-major order.
+        player (int): The player to move.
+        depth (int): The ply of the node in the search.
+        pv_move (int): The principal variation move at this node, or None.
+        table_move (int): The transposition table's best move at this node, or None.
+    Runtime: O(n log n) where n is the number of moves
+    """
+
+    def order(self, board, moves, player, depth, pv_move=None, table_move=None):
+        cells = board.cells
+        thresholds = board.topology.thresholds
+        killers = self.killers[depth] if depth < len(
+            self.killers) else (None, None)
+        history = self.history
+
+        def score(index):
+            if index == pv_move:
+                return PV_SCORE
+            if index == table_move:
+                return TABLE_SCORE
+            if index == killers[0]:
+                return KILLER_SCORES[0]
+            if index == killers[1]:
+                return KILLER_SCORES[1]
+            value = history.get((player, index), 0)
+            if cells[index] * player == thresholds[index] - 1:
+                value += OVERFLOW_HINT_SCORE
+            return value
+
+        return sorted(moves, key=score, reverse=True)
+
+    """
+    Record the move that caused a beta cutoff
+    Parameters:
+        player (int): The player who played the move.
+        index (int): Flat index of the move.
+        depth (int): The ply of the node in the search.
+        remaining (int): The plies left below the node; deeper cutoffs weigh more.
+        first (bool): Whether the move was the first one tried at the node.
+    Runtime: O(1)
+    """
+
+    def record_cutoff(self, player, index, depth, remaining, first):
+        self.cutoffs += 1
+        if first:
+            self.first_move_cutoffs += 1
+        while len(self.killers) <= depth:
+            self.killers.append((None, None))
+        killers = self.killers[depth]
+        if killers[0] != index:
+            self.killers[depth] = (index, killers[0])
+        key = (player, index)
+        self.history[key] = self.history.get(key, 0) + remaining * remaining
+
+    """
+    Prepare for a new search: killers are forgotten and history scores are halved so that
+    older searches weigh less
+    Runtime: O(n) where n is the number of history entries
+    """
+
+    def age(self):
+        self.killers = []
+        for key in self.history:
+            self.history[key] //= 2
+
+    """
+    Return the fraction of cutoffs produced by the first move tried, a measure of how good the
+    ordering is (1.0 is perfect)
+    Runtime: O(1)
+    """
+
+    def first_move_cutoff_rate(self):
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0
@@ -0,0 +1,166 @@
+import argparse
+import mmap
+import os
+import struct
+import sys
+
+from Grid import Grid
+from GameTree import GameTree, generate_moves, make_move
+from Symmetry import canonical_key, transform_index
+
+# The book that the bots load when it exists
+BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "opening_book.bin")
+
+# File layout: a header (magic, board rows, board cols, number of entries) followed by the
+# entries sorted by key. Each entry is a 64-bit canonical position key (see Symmetry), the flat
+# index of the book move in the canonical form and the tree height it was searched to. One entry
+# serves every position equivalent to it.
+MAGIC = b"OBK2"
+HEADER = struct.Struct("<4sHHI")
+ENTRY = struct.Struct("<QHH")
+
+
+# Opening moves read from a book file through a read-only memory map.
+# Nothing is read up front: a lookup binary-searches the sorted entries in the mapped file, so
+# loading is instant whatever the size of the book, and pages are only read from disk as the
+# search touches them.
+class OpeningBook:
+    def __init__(self, path=BOOK_PATH):
+        with open(path, "rb") as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.rows, self.cols, self.count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or HEADER.size + self.count * ENTRY.size > len(self.data):
+            self.data.close()
+            raise ValueError("{} is not an opening book".format(path))
+        self.hits = 0
+        self.misses = 0
+
+    """
+    Look up the book move for a position
+    Parameters:
+        board (Grid): The position.
+        player (int): The player to move.
+    Return: the (row, col) of the book move, or None if the position is not in the book. Books
+        are built under the uncapped rules, so boards with a wave cap are never in the book.
+    Runtime: O(log n) where n is the number of entries
+    """
+
+    def lookup(self, board, player):
+        if board.height != self.rows or board.width != self.cols or board.max_waves is not None:
+            return None
+        key, transform = canonical_key(board, player)
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            entry_key, move, _ = ENTRY.unpack_from(
+                self.data, HEADER.size + middle * ENTRY.size)
+            if entry_key < key:
+                low = middle + 1
+            elif entry_key > key:
+                high = middle
+            else:
+                self.hits += 1
+                return divmod(transform_index(board, transform, move), self.cols)
+        self.misses += 1
+        return None
+
+    """
+    Unmap the book file
+    """
+
+    def close(self):
+        self.data.close()
+
+
+"""
+Opens the book at path, or returns None if there is no book file there.
+"""
+
+
+def load_book(path=BOOK_PATH):
+    if not os.path.exists(path):
+        return None
+    return OpeningBook(path)
+
+
+"""
+Builds the book entries by searching from the standard start position. For each side, the
+positions where that side is to move get the move a search of the given tree height chooses, and
+only that move is followed; at the other side's turns every reply is followed. Equivalent
+positions are only searched and followed once.
+
+Parameters:
+    rows (int): Number of rows of the board.
+    cols (int): Number of columns of the board.
+    plies (int): How many plies from the start the book covers.
+    tree_height (int): The tree height each book move is searched to.
+
+Returns:
+    dict: (book move as a flat index in the canonical form, tree height), keyed by canonical
+        position key.
+"""
+
+
+def build_entries(rows=5, cols=6, plies=4, tree_height=5):
+    start = Grid(rows, cols)
+    start.set(0, 0, 1)
+    start.set(rows - 1, cols - 1, -1)
+
+    entries = {}
+    for side in (1, -1):
+        positions = [start]
+        player = 1
+        for _ in range(plies):
+            # The positions of the next ply, one per canonical key
+            next_positions = {}
+            for board in positions:
+                if player == side:
+                    key, transform = canonical_key(board, player)
+                    if key not in entries:
+                        row, col = GameTree(board, player, tree_height).best_move
+                        entries[key] = (transform_index(board, transform, board.index(row, col)),
+                                        tree_height)
+                    moves = [transform_index(board, transform, entries[key][0])]
+                else:
+                    moves = generate_moves(board, player)
+                for index in moves:
+                    child = make_move(board, index, player)
+                    next_positions.setdefault(canonical_key(child, -player)[0], child)
+            positions = list(next_positions.values())
+            player = -player
+    return entries
+
+
+"""
+Writes book entries (as returned by build_entries) to a book file, sorted by key.
+"""
+
+
+def write_book(path, entries, rows=5, cols=6):
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, rows, cols, len(entries)))
+        for key in sorted(entries):
+            move, height = entries[key]
+            file.write(ENTRY.pack(key, move, height))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Build an opening book by searching from the standard start position.")
+    parser.add_argument("-o", "--output", default=BOOK_PATH)
+    parser.add_argument("-p", "--plies", type=int, default=4,
+                        help="plies from the start the book covers (default 4)")
+    parser.add_argument("--height", type=int, default=5,
+                        help="tree height of the search of each book move (default 5)")
+    parser.add_argument("--rows", type=int, default=5)
+    parser.add_argument("--cols", type=int, default=6)
+    args = parser.parse_args(argv)
+
+    entries = build_entries(args.rows, args.cols, args.plies, args.height)
+    write_book(args.output, entries, args.rows, args.cols)
+    print("wrote {} positions to {}".format(len(entries), args.output))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,10 @@
-from SimpleQueue import Queue
-import copy
-
-
 """
 Identifies cells in a grid that are 'overflowing'. A cell is considered overflowing if the 
 absolute value of its content is greater than or equal to the number of its immediate 
 neighbours.
 
 Parameters:
-    grid (list of list of int): The grid to check for overflow cells.
+    grid (Grid): The grid to check for overflow cells.
 
 Returns:
     list: A list of (row, col) tuples for each overflowing cell. 
@@ -18,8 +14,8 @@ Returns:
 
 def get_overflow_list(grid):
     overflow_list = []  # Initialize an empty list to store coordinates of overflowing cells
-    row_count = len(grid)
-    col_count = len(grid[0])
+    row_count = grid.height
+    col_count = grid.width
 
     # Iterate over each cell in the grid to check for overflow condition
     for curr_row in range(row_count):
@@ -28,7 +24,7 @@ def get_overflow_list(grid):
             neighbours_count = get_neighbours_count(
                 curr_row, curr_col, row_count, col_count)
             # Check if cell is overflowing; if so, add its coordinates to the list
-            if abs(grid[curr_row][curr_col]) >= neighbours_count:
+            if abs(grid.get(curr_row, curr_col)) >= neighbours_count:
                 overflow_list.append((curr_row, curr_col))
 
     # Return the list of overflowing cells or None if the list is empty
@@ -36,41 +32,159 @@ def get_overflow_list(grid):
 
 
 """
-Recursively performs an overflow process in a grid until stability is reached.  Stability 
-is reached when all cells have the same sign or no further overflow operations are 
-possible.  Each intermediate state of the grid during the overflow process is stored in a_queue.
+Performs the overflow process in a grid until stability is reached.  Stability is reached 
+when all cells have the same sign or no further overflow operations are possible.
+
+The process is iterative: the first wave scans the whole grid, and every later wave only 
+re-checks the cells touched by the previous one (the overflowing cells and their 
+neighbours), since no other cell can have changed.  The grid's per-player cell and gem counts 
+are adjusted for the touched cells only, which also makes the "all same sign" test O(1) per wave, 
+and so are its legal move bitsets.
+
+Tracing is opt-in: when a trace queue is given, each wave enqueues the list of cells it 
+changed as (row, col, new_value) tuples, so the waves can be replayed from the starting grid 
+without storing a copy of the board per wave.  Search code passes no trace and pays nothing.
+
+The first wave can be limited to the cells that changed since the grid last settled (see 
+Grid.overflow_start): after a single move only the cell it was played on and the cells an 
+earlier capped overflow left overflowing can overflow, so the whole cascade then only ever looks 
+at its active frontier, whatever the size of the board.  When the grid has a wave cap 
+(Grid.max_waves), the overflow stops after that many waves, and the cells still overflowing are 
+recorded in Grid.pending.
 
 Parameters:
-    grid (list of list of int): The grid to run overflow on.
-    a_queue (Queue): A queue object to store the intermediate states of the grid for tracking.
+    grid (Grid): The grid to run overflow on.
+    trace (Queue): Optional queue that receives the changed cells of each wave.
+    changed (set): Optional set that receives the flat index of every cell a wave touched.
+    start (iterable): Optional flat indices of the only cells that can overflow in the first 
+        wave; every cell is checked when it is None.
 
 Returns:
     int: The number of overflow iterations performed.
 """
 
 
-def overflow(grid, a_queue=Queue()):
+def overflow(grid, trace=None, changed=None, start=None):
     # Ensure grid is not empty
-    if grid is not None:
-        # Get the list of overflowing cells
-        overflow_cell_list = get_overflow_list(grid)
-        # Proceed if there are any overflowing cells
-        if overflow_cell_list is not None:
-            # Early exit if all cells already share the same sign
-            if not all_signs_equal(grid):
-                # Determine the sign of overflow based on the first overflowing cell
-                overflow_sign = 1 if grid[overflow_cell_list[0]
-                                          [0]][overflow_cell_list[0][1]] > 0 else -1
-                # Set all overflowing cells to 0
-                for row, col in overflow_cell_list:
-                    grid[row][col] = 0
-                # Increase the value of neighbour cells based on the overflow sign
-                for row, col in overflow_cell_list:
-                    increase_neighbour_cells(row, col, grid, overflow_sign)
-                # Save the current state of the grid in the queue and recursively call overflow
-                a_queue.enqueue(copy.deepcopy(grid))
-                return 1 + overflow(grid, a_queue)
-        return 0  # Return 0 if no overflow operations were performed
+    if grid is None:
+        return None
+    cells = grid.cells
+    topology = grid.topology
+    thresholds = topology.thresholds
+    neighbours = topology.neighbours
+
+    # Start from the grid's counts; each wave only adjusts the counts of the cells it touches
+    counts = (grid.positive_cells, grid.negative_cells, grid.positive_gems, grid.negative_gems)
+    moves = (grid.positive_moves, grid.negative_moves)
+
+    max_waves = grid.max_waves
+
+    # Unless told where to start, the first wave has to look at every cell
+    candidates = range(grid.size) if start is None else start
+    waves = 0
+    while True:
+        # Get the list of overflowing cells among the candidates, in row-major order
+        overflow_cell_list = sorted(
+            index for index in candidates if abs(cells[index]) >= thresholds[index])
+        # Stop if there are no overflowing cells, all cells already share the same sign or the
+        # wave cap is reached
+        if (not overflow_cell_list or counts[0] == 0 or counts[1] == 0
+                or (max_waves is not None and waves >= max_waves)):
+            grid.positive_cells, grid.negative_cells, grid.positive_gems, grid.negative_gems = counts
+            grid.positive_moves, grid.negative_moves = moves
+            # The cells left overflowing when the cap or a win stopped the cascade early
+            grid.pending = tuple(overflow_cell_list)
+            return waves
+
+        # Collect every cell this wave can change: the overflowing cells and their neighbours
+        touched = set(overflow_cell_list)
+        for index in overflow_cell_list:
+            touched.update(neighbours[index])
+        counts = update_counts(cells, touched, counts, -1)
+        if trace is not None or grid.zobrist is not None:
+            before = {index: cells[index] for index in touched}
+
+        # Determine the sign of overflow based on the first overflowing cell
+        overflow_sign = 1 if cells[overflow_cell_list[0]] > 0 else -1
+        # Set all overflowing cells to 0
+        for index in overflow_cell_list:
+            cells[index] = 0
+        # Increase the value of neighbour cells based on the overflow sign, flipping their sign
+        for index in overflow_cell_list:
+            for neighbour in neighbours[index]:
+                cells[neighbour] = abs(cells[neighbour]) * overflow_sign + overflow_sign
+
+        counts = update_counts(cells, touched, counts, 1)
+        moves = update_move_sets(cells, touched, moves)
+        # Keep the grid's Zobrist key in step with the changed cells
+        if grid.zobrist is not None:
+            for index in touched:
+                grid.update_zobrist(index, before[index], cells[index])
+        # Record the cells this wave changed; only touched cells need checking next wave
+        if trace is not None:
+            trace.enqueue([topology.coordinates[index] + (cells[index],)
+                           for index in sorted(touched) if cells[index] != before[index]])
+        if changed is not None:
+            changed.update(touched)
+        candidates = touched
+        waves += 1
+
+
+"""
+Adds (direction 1) or removes (direction -1) the given cells from running per-player counts.
+
+Parameters:
+    cells (array of int): The flat cells of the grid.
+    indices (iterable): Flat indices of the cells to count.
+    counts (tuple): The current (positive cells, negative cells, positive gems, negative gems).
+    direction (int): 1 to add the cells to the counts, -1 to remove them.
+
+Returns:
+    tuple: The updated counts.
+"""
+
+
+def update_counts(cells, indices, counts, direction):
+    positive_count, negative_count, positive_gems, negative_gems = counts
+    for index in indices:
+        cell = cells[index]
+        if cell > 0:
+            positive_count += direction
+            positive_gems += cell * direction
+        elif cell < 0:
+            negative_count += direction
+            negative_gems -= cell * direction
+    return positive_count, negative_count, positive_gems, negative_gems
+
+
+"""
+Sets the bits of the given cells in the legal move bitsets of both players from their values.
+
+Parameters:
+    cells (array of int): The flat cells of the grid.
+    indices (iterable): Flat indices of the cells that may have changed.
+    moves (tuple): The current (player 1 moves, player 2 moves) bitsets.
+
+Returns:
+    tuple: The updated bitsets.
+"""
+
+
+def update_move_sets(cells, indices, moves):
+    positive_moves, negative_moves = moves
+    for index in indices:
+        bit = 1 << index
+        cell = cells[index]
+        if cell > 0:
+            positive_moves |= bit
+            negative_moves &= ~bit
+        elif cell < 0:
+            positive_moves &= ~bit
+            negative_moves |= bit
+        else:
+            positive_moves |= bit
+            negative_moves |= bit
+    return positive_moves, negative_moves
 
 
 """
@@ -99,11 +213,38 @@ def get_neighbours_count(row, col, row_count, column_count):
         return 4
 
 
+"""
+Lists the orthogonal neighbours of a given cell in a grid.
+
+Parameters:
+    row (int): The row index of the cell.
+    col (int): The column index of the cell.
+    row_count (int): Total number of rows in the grid.
+    column_count (int): Total number of columns in the grid.
+
+Returns:
+    list: (row, col) tuples of the neighbouring cells.
+"""
+
+
+def get_neighbours(row, col, row_count, column_count):
+    neighbours = []
+    if row > 0:
+        neighbours.append((row-1, col))
+    if row < row_count - 1:
+        neighbours.append((row+1, col))
+    if col > 0:
+        neighbours.append((row, col-1))
+    if col < column_count - 1:
+        neighbours.append((row, col+1))
+    return neighbours
+
+
 """
 Checks if all non-zero cells in the grid have the same sign.
 
 Parameters:
-    grid (list of list of int): The grid to check.
+    grid (Grid): The grid to check.
 
 Returns:
     bool: True if all non-zero cells have the same sign, False otherwise.
@@ -111,21 +252,9 @@ Returns:
 
 
 def all_signs_equal(grid):
-    sign = None
-    # Iterate over each cell in the grid
-    for row in grid:
-        for cell in row:
-            # Ignore zero cells
-            if cell != 0:
-                # Initialize sign for the first non-zero cell
-                if sign is None:
-                    sign = 1 if cell > 0 else -1
-                else:
-                    # Check if current cell's sign is different from the initial sign
-                    if (sign == 1 and cell < 0) or (sign == -1 and cell > 0):
-                        return False
-    # Return True if all non-zero cells have the same sign or the grid is empty
-    return True
+    # The grid counts the cells of each sign, so one of the counts is zero exactly when the
+    # non-zero cells share a sign
+    return grid.positive_cells == 0 or grid.negative_cells == 0
 
 
 """
@@ -134,29 +263,18 @@ Increases the value of the neighbouring cells of a given cell by 1, adjusting th
 Parameters:
     row (int): Row index of the cell.
     col (int): Column index of the cell.
-    grid (list of list of int): The grid to modify.
+    grid (Grid): The grid to modify.
     sign (int): The sign (+1 or -1) to use for the increment.
 """
 
 
 def increase_neighbour_cells(row, col, grid, sign):
-    row_count = len(grid)
-    col_count = len(grid[0])
     to_add = 1 * sign  # Value to add to each neighbour cell
 
-    # If within bounds, adjust neighbouring cells' sign and apply the increment
-    if row > 0:
-        adjust_cell_sign(row-1, col, grid, sign)
-        grid[row-1][col] += to_add
-    if row < row_count - 1:
-        adjust_cell_sign(row+1, col, grid, sign)
-        grid[row+1][col] += to_add
-    if col > 0:
-        adjust_cell_sign(row, col-1, grid, sign)
-        grid[row][col-1] += to_add
-    if col < col_count - 1:
-        adjust_cell_sign(row, col+1, grid, sign)
-        grid[row][col+1] += to_add
+    # Adjust each neighbouring cell's sign and apply the increment
+    for n_row, n_col in get_neighbours(row, col, grid.height, grid.width):
+        adjust_cell_sign(n_row, n_col, grid, sign)
+        grid.set(n_row, n_col, grid.get(n_row, n_col) + to_add)
 
 
 """
@@ -165,13 +283,13 @@ Adjusts the sign of a cell's value in the grid, preserving its magnitude.
 Parameters:
     row (int): Row index of the cell.
     col (int): Column index of the cell.
-    grid (list of list of int): The grid to modify.
+    grid (Grid): The grid to modify.
     sign (int): The sign (+1 or -1) to apply to the cell's value.
 """
 
 
 def adjust_cell_sign(row, col, grid, sign):
     # Only adjust non-zero cells
-    if grid[row][col] != 0:
+    if grid.get(row, col) != 0:
         # Adjust sign while preserving magnitude
-        grid[row][col] = abs(grid[row][col]) * sign
+        grid.set(row, col, abs(grid.get(row, col)) * sign)
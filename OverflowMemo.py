@@ -0,0 +1,129 @@
+from collections import OrderedDict
+
+from Overflow import overflow
+
+# Default number of (position, move) results a memo keeps
+MEMO_ENTRIES = 32768
+# Default number of bytes a memo's entries may take up, as estimated by entry_bytes
+MEMO_BYTES = 64 * 1024 * 1024
+# Bytes an entry takes up besides its board and cells: the key and entry tuples, the Grid object
+# and its counters, and the dictionary slot
+ENTRY_OVERHEAD = 600
+
+
+"""
+Returns an estimate of the bytes a memo entry for the board takes up: the cell bytes of its key,
+the cells of the stored board, its two legal move bitsets (a bit per cell each) and the changed
+cells.
+"""
+
+
+def entry_bytes(board, changed):
+    return ENTRY_OVERHEAD + 2 * board.size + board.size // 4 + 8 * len(changed)
+
+
+# Least-recently-used memo of played moves.
+# Searches play the same move on the same position many times: in sibling subtrees reached
+# through other move orders, in every iteration of iterative deepening and again on the bot's next
+# turn. The memo keeps the board each move led to, the number of overflow waves it took and the
+# cells they touched, so a repeated move costs a dictionary lookup and a board copy instead of a
+# whole cascade.
+#
+# Most moves do not fill their cell up to its overflow threshold. On a settled board (see
+# Grid.is_settled) nothing else on it overflows either, so such a move sets off no cascade and
+# playing it again costs less than a lookup. Those moves are played directly and never stored,
+# which leaves the memo for the cascades.
+#
+# Entries are keyed by the position's cell bytes (see Grid.key), the move, the player making it
+# and the board's wave cap. The bytes hash quickly and, unlike a Zobrist key, cannot collide, and
+# reading them does not make the position track a Zobrist key through every later move. Once
+# max_entries results are stored, or their entries take up more than max_bytes, the least
+# recently used ones are evicted to make room for every new one. Each entry holds a whole board,
+# so on big boards the byte limit is the one that counts.
+class OverflowMemo:
+    def __init__(self, max_entries=MEMO_ENTRIES, max_bytes=MEMO_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        # Estimated bytes taken up by the entries (see entry_bytes)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    """
+    Play a move on a copy of the board, from the memo when it has been played before
+    Parameters:
+        board (Grid): The position the move is played on; it is left untouched.
+        index (int): Flat index of the move.
+        player (int): The player making the move.
+    Return: (new board, overflow waves, flat indices of the cells the move may have changed)
+    Runtime: O(n) for the board copy on a hit, plus the overflow on a miss
+    """
+
+    def play(self, board, index, player):
+        settled = board.is_settled()
+        if settled and abs(board.cells[index]) + 1 < board.topology.thresholds[index]:
+            # A quiet move: the cell stays below its threshold, so nothing overflows
+            new_board = board.clone()
+            new_board.add(index, player)
+            return new_board, 0, (index,)
+
+        key = (board.key(), index, player, board.max_waves)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[0].clone(), entry[1], entry[2]
+
+        self.misses += 1
+        new_board = board.clone()
+        new_board.add(index, player)
+        changed = {index}
+        waves = overflow(new_board, changed=changed, start=board.overflow_start(index))
+        # The memo keeps its own copy, so callers are free to change the board they get
+        size = entry_bytes(new_board, changed)
+        self.entries[key] = (new_board.clone(), waves, tuple(changed), size)
+        self.bytes += size
+        while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+            self.bytes -= self.entries.popitem(last=False)[1][3]
+            self.evictions += 1
+        return new_board, waves, changed
+
+    """
+    Return the fraction of looked up moves that were found in the memo
+    Runtime: O(1)
+    """
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    """
+    Return the memo's counters as a dictionary
+    Runtime: O(1)
+    """
+
+    def stats(self):
+        return {
+            "capacity": self.max_entries,
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate(),
+            "evictions": self.evictions,
+        }
+
+    """
+    Remove every entry and reset the counters
+    Runtime: O(n) where n is the number of entries
+    """
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
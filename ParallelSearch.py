@@ -0,0 +1,205 @@
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from Grid import Grid
+from GameTree import (GameTree, MAX_TREE_HEIGHT, SearchCancelled, SearchTimeout, generate_moves,
+                      root_alpha)
+from MoveOrdering import MoveOrderer
+from OverflowMemo import OverflowMemo
+from TranspositionTable import TranspositionTable
+
+# How often (in seconds) the parent checks its stop event while waiting for the workers
+POLL_INTERVAL = 0.05
+
+# State of a worker process, set up once by init_worker() and kept between searches
+worker_best = None
+worker_cancel = None
+worker_table = None
+worker_orderer = None
+worker_memo = None
+
+
+def init_worker(best, cancel):
+    global worker_best, worker_cancel, worker_table, worker_orderer, worker_memo
+    worker_best = best
+    worker_cancel = cancel
+    worker_table = TranspositionTable()
+    worker_orderer = MoveOrderer()
+    worker_memo = OverflowMemo()
+
+
+"""
+Searches one root move in a worker process. The alpha bound comes from the best root score any
+worker has found so far in the same search, and the shared best is updated with the result, so
+moves searched later get the benefit of every earlier result.
+
+Parameters:
+    board (Grid): The root position.
+    player (int): The player to move at the root.
+    tree_height (int): The height of the search tree.
+    index (int): Flat index of the root move to search.
+    search_id (int): Identifies the search the move belongs to.
+    deadline (float): time.monotonic() value to stop at, or None.
+    pv (list): Principal variation to search first, or None.
+
+Returns:
+    tuple: (index, evaluation) of the root move.
+"""
+
+
+def search_root_move(board, player, tree_height, index, search_id, deadline, pv):
+    with worker_best.get_lock():
+        if worker_best[0] != search_id:
+            # The search this move belonged to is already over
+            raise SearchCancelled()
+        best_value, best_index = worker_best[1], worker_best[2]
+    best_index = None if best_index < 0 else int(best_index)
+
+    tree = GameTree(board, player, tree_height, worker_table, pv if pv and pv[0] == index else None,
+                    deadline, worker_orderer, stop=worker_cancel, search=False, memo=worker_memo)
+    evaluation = tree.search_move(
+        index, root_alpha(best_value, best_index, index))
+
+    with worker_best.get_lock():
+        if worker_best[0] == search_id and (
+                evaluation > worker_best[1] or
+                (evaluation == worker_best[1] and (worker_best[2] < 0 or index < worker_best[2]))):
+            worker_best[1] = evaluation
+            worker_best[2] = index
+    return index, evaluation
+
+
+# Root-split parallel search over a pool of worker processes.
+# The first root move is searched alone so that the rest start with a real alpha bound (young
+# brothers wait), then the other root moves are spread over the workers. The workers share the
+# best root score found so far, and every move is searched with the same tie-breaking window as
+# the serial GameTree, so the chosen move is the one GameTree would choose at the same depth.
+#
+# The worker processes (and their transposition tables, move orderers and overflow memos) stay
+# alive between searches until close() is called. As with any multiprocessing code, a script that
+# creates a ParallelSearch must do so under an `if __name__ == "__main__":` guard on platforms
+# that spawn worker processes.
+class ParallelSearch:
+    def __init__(self, workers=2):
+        self.workers = workers
+        self.executor = None
+        self.search_id = 0
+        # Shared [search id, best evaluation, best move index] of the running search
+        self.best = multiprocessing.Array("d", [0, float("-inf"), -1])
+        self.cancel = multiprocessing.Event()
+
+    # Start the worker processes on first use
+    def get_executor(self):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker,
+                                                initargs=(self.best, self.cancel))
+        return self.executor
+
+    """
+    Search the board to a fixed tree height
+    Parameters:
+        board (Grid or list of lists): The position to search.
+        player (int): The player to move (1 or -1).
+        tree_height (int): The height of the search tree, as for GameTree.
+        deadline (float): time.monotonic() value after which SearchTimeout is raised, or None.
+        stop (threading.Event): Optional event that cancels the search with SearchCancelled.
+        pv (list): Principal variation to search first, or None.
+    Return: a (move, evaluation) tuple with the chosen (row, col) move, or (None, None) if the
+        player has no move
+    """
+
+    def search(self, board, player, tree_height=4, deadline=None, stop=None, pv=None):
+        if not isinstance(board, Grid):
+            board = Grid.from_lists(board)
+        moves = generate_moves(board, player)
+        if tree_height <= 1 or not moves:
+            return None, None
+        if pv and pv[0] in moves:
+            moves.remove(pv[0])
+            moves.insert(0, pv[0])
+
+        executor = self.get_executor()
+        self.search_id += 1
+        with self.best.get_lock():
+            self.best[0] = self.search_id
+            self.best[1] = float("-inf")
+            self.best[2] = -1
+        self.cancel.clear()
+
+        def submit(index):
+            return executor.submit(search_root_move, board, player, tree_height, index,
+                                   self.search_id, deadline, pv)
+
+        results = []
+        pending = set()
+        try:
+            # Young brothers wait: the first move establishes the alpha bound for the rest
+            pending = {submit(moves[0])}
+            self.wait_all(pending, results, stop)
+            pending = {submit(index) for index in moves[1:]}
+            self.wait_all(pending, results, stop)
+        except (SearchCancelled, SearchTimeout):
+            self.abort(pending)
+            raise
+
+        best_index, best_value = None, float("-inf")
+        for index, evaluation in results:
+            if evaluation > best_value or (evaluation == best_value and index < best_index):
+                best_index, best_value = index, evaluation
+        return divmod(best_index, board.width), best_value
+
+    # Collect the results of the futures into results, checking the stop event while waiting
+    def wait_all(self, pending, results, stop):
+        while pending:
+            done, not_done = wait(
+                pending, timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.discard(future)
+                results.append(future.result())
+            if stop is not None and stop.is_set():
+                raise SearchCancelled()
+
+    # Cancel the moves not started yet and wait for the running ones to notice the cancel event
+    def abort(self, pending):
+        self.cancel.set()
+        for future in pending:
+            future.cancel()
+        wait(pending)
+        with self.best.get_lock():
+            self.best[0] = -1
+
+    """
+    Search with iterative deepening until the time budget runs out, like
+    GameTree.search_with_budget. The first iteration always completes.
+    Return: the (row, col) of the chosen move, or None if the player has no move
+    """
+
+    def search_with_budget(self, board, player, time_budget, max_height=MAX_TREE_HEIGHT, stop=None):
+        if not isinstance(board, Grid):
+            board = Grid.from_lists(board)
+        deadline = time.monotonic() + time_budget
+        best_move = None
+        pv = None
+        for height in range(2, max_height + 1):
+            try:
+                move, evaluation = self.search(board, player, height,
+                                               deadline if best_move is not None else None, stop, pv)
+            except SearchTimeout:
+                break
+            if move is None:
+                break
+            best_move = move
+            pv = [board.index(*move)]
+            if time.monotonic() >= deadline:
+                break
+        return best_move
+
+    """
+    Shut the worker processes down
+    """
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
@@ -1,20 +1,112 @@
-from GameTree import GameTree
+import time
+
+from OpeningBook import BOOK_PATH, load_book
+from OverflowMemo import OverflowMemo
+from ParallelSearch import ParallelSearch
+from SearchEngine import SearchEngine
+from SearchStats import SearchStats
+from Solver import Solver, shared_cache
 
 
 class PlayerOne:
 
-    def __init__(self, name="P1 Bot"):
+    def __init__(self, name="P1 Bot", workers=1, book=BOOK_PATH, solver=True):
         self.name = name
         self.difficulty = 4
+        # Seconds per move; None searches to the fixed difficulty depth instead
+        self.time_budget = None
+        # Transposition table, move ordering and expected line of play, kept between moves
+        self.engine = SearchEngine(1)
+        # Opening moves come from the book file, when there is one
+        self.engine.book = load_book(book) if book is not None else None
+        # Endgames are tried with the solver first, if it is on; solved positions are kept on disk,
+        # in a cache shared with the other players in the process
+        self.engine.solver = Solver(shared_cache()) if solver else None
+        # Root-split search over worker processes when more than one worker is asked for
+        self.parallel = None
+        # SearchStats of the last search, when enabled with enable_stats()
+        self.stats = None
+        self.change_workers(workers)
 
     def get_name(self):
         return self.name
 
-    def get_play(self, board):
-        tree = GameTree(board, 1, self.difficulty)
-        (row, col) = tree.get_move()
+    # Choose a move for the board. Setting the stop event (a threading.Event) from another thread
+    # cancels the search with GameTree.SearchCancelled.
+    def get_play(self, board, time_budget=None, stop=None):
+        if time_budget is None:
+            time_budget = self.time_budget
+        if self.parallel is None:
+            # The engine answers from the opening book and the solver itself
+            (row, col) = self.engine.search(
+                board, self.difficulty, time_budget, stop)
+        else:
+            start = time.monotonic()
+            known_move = self.engine.known_move(board, time_budget, stop)
+            if known_move is not None:
+                (row, col) = known_move
+            elif time_budget is not None:
+                # The time the book and the solver took comes out of the budget
+                remaining = max(0.0, time_budget - (time.monotonic() - start))
+                (row, col) = self.parallel.search_with_budget(
+                    board, 1, remaining, stop=stop)
+            else:
+                (row, col), _ = self.parallel.search(
+                    board, 1, self.difficulty, stop=stop)
         return (row, col)
 
+    # Tell the player which move its opponent answered with, so its next search can start from
+    # the line it already searched
+    def opponent_played(self, move, board=None):
+        self.engine.advance(move, board)
+
+    # Think about the opponent's likely replies in the background until the opponent moves
+    # (opponent_played), the next search starts or stop_pondering() is called
+    def start_pondering(self):
+        self.engine.start_pondering()
+
+    # Stop thinking on the opponent's time
+    def stop_pondering(self):
+        self.engine.stop_pondering()
+
+    # Collect search statistics (a SearchStats in self.stats, refilled by every search) or stop
+    # collecting them. Searches spread over worker processes collect none.
+    def enable_stats(self, enabled=True):
+        self.stats = SearchStats() if enabled else None
+        self.engine.stats = self.stats
+
     # Set the difficulty of the player
     def change_difficulty(self, new_difficulty):
         self.difficulty = new_difficulty
+
+    # Set the time the player may think per move, in seconds
+    def change_time_budget(self, new_time_budget):
+        self.time_budget = new_time_budget
+
+    # Set how many played moves the search keeps in its overflow memo; 0 switches the memo off
+    def change_memo(self, entries):
+        self.engine.memo = OverflowMemo(entries) if entries else None
+
+    # Set the number of worker processes the search is spread over (1 searches in-process)
+    def change_workers(self, workers):
+        self.close_workers()
+        self.workers = workers
+        if workers > 1:
+            self.parallel = ParallelSearch(workers)
+
+    # Stop pondering, shut down the worker processes, if any, close the opening book and save
+    # the positions the solver solved
+    def close(self):
+        self.engine.stop_pondering()
+        self.close_workers()
+        if self.engine.solver is not None:
+            self.engine.solver.cache.save()
+        if self.engine.book is not None:
+            self.engine.book.close()
+            self.engine.book = None
+
+    # Shut down the worker processes, if any
+    def close_workers(self):
+        if self.parallel is not None:
+            self.parallel.close()
+            self.parallel = None
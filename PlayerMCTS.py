@@ -0,0 +1,70 @@
+import time
+
+from MonteCarloTree import MonteCarloTree
+from SearchStats import SearchStats
+
+
+class PlayerMCTS:
+
+    def __init__(self, player, name=None, evaluate=False):
+        self.player = player
+        self.name = name if name is not None else "P{} MCTS Bot".format(
+            1 if player == 1 else 2)
+        # Iterations per move when there is no time budget
+        self.iterations = 1000
+        # Seconds per move; None runs the fixed number of iterations instead
+        self.time_budget = None
+        # Monte Carlo tree, kept between moves
+        self.engine = MonteCarloTree(player, evaluate)
+        # SearchStats of the last search, when enabled with enable_stats()
+        self.stats = None
+
+    def get_name(self):
+        return self.name
+
+    # Choose a move for the board. Setting the stop event (a threading.Event) from another thread
+    # cancels the search with GameTree.SearchCancelled.
+    def get_play(self, board, time_budget=None, stop=None):
+        if time_budget is None:
+            time_budget = self.time_budget
+        start = time.monotonic()
+        if time_budget is not None:
+            (row, col) = self.engine.search(board, None, time_budget, stop)
+        else:
+            (row, col) = self.engine.search(
+                board, self.iterations, stop=stop)
+        if self.stats is not None:
+            # Each iteration adds one node to the tree
+            self.stats.reset()
+            self.stats.nodes = self.engine.iterations
+            self.stats.record_iteration(
+                0, time.monotonic() - start, self.engine.iterations)
+        return (row, col)
+
+    # The tree finds the opponent's reply by itself at the next search
+    def opponent_played(self, move, board=None):
+        pass
+
+    # Monte Carlo search does not ponder
+    def start_pondering(self):
+        pass
+
+    def stop_pondering(self):
+        pass
+
+    # Collect search statistics (only nodes and time for Monte Carlo search) or stop collecting
+    # them
+    def enable_stats(self, enabled=True):
+        self.stats = SearchStats() if enabled else None
+
+    # Set the number of iterations per move
+    def change_difficulty(self, new_difficulty):
+        self.iterations = new_difficulty
+
+    # Set the time the player may think per move, in seconds
+    def change_time_budget(self, new_time_budget):
+        self.time_budget = new_time_budget
+
+    # Nothing to shut down
+    def close(self):
+        pass
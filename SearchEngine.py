@@ -0,0 +1,303 @@
+import threading
+import time
+
+from Grid import Grid
+from BatchOverflow import score_moves
+from GameTree import (GameTree, MAX_TREE_HEIGHT, SearchCancelled, generate_moves, iterative_deepening,
+                      make_move)
+from MoveOrdering import MoveOrderer
+from OverflowMemo import OverflowMemo
+from Solver import WIN, is_endgame
+from TranspositionTable import TranspositionTable
+
+# How many of the opponent's replies are pondered
+PONDER_REPLIES = 4
+# How many positions the endgame solver may expand per move
+SOLVER_NODES = 500
+# Fraction of a move's time budget the endgame solver may use; the search gets the rest
+SOLVER_SHARE = 0.5
+
+
+# Search state a bot keeps from one move to the next.
+# The transposition table and move ordering persist between searches. The engine also remembers
+# the line it expects to be played: after each search, the position its move leads to and the
+# principal variation below it. When the opponent answers with the predicted reply, the next
+# search is seeded with the rest of that variation, and the table already holds the results for
+# the subtree of the new position, so the turn starts from an already searched position instead
+# of a cold one.
+#
+# Between its move and the opponent's reply the engine can ponder: a background thread searches
+# the opponent's most likely replies ever deeper, filling the table and a cache of best answers
+# per reply. When the opponent plays a pondered reply, the answer comes straight from the cache if
+# it was pondered at the height of a fixed-height search, or, for a budgeted search, at least as
+# deep as the last budgeted search reached. Otherwise a budgeted search continues from the
+# deepest pondered variation. Only budgeted searches set that height, so answers from the cache,
+# the book or the solver never lower the bar. Pondering stops as soon as the engine is told about the reply,
+# is asked to search, or stop_pondering() is called.
+#
+# Moves played while searching are kept in an OverflowMemo shared by every search, pondering
+# included, so the moves that later iterations and later turns play again come from the memo.
+# Setting memo to None switches it off.
+#
+# Positions in the opening book, when one is set, are answered from the book without searching,
+# and in endgames a solver, when one is set, gets a first try at proving a win.
+class SearchEngine:
+    def __init__(self, player, table=None, orderer=None, memo=None):
+        self.player = player
+        self.table = table if table is not None else TranspositionTable()
+        self.orderer = orderer if orderer is not None else MoveOrderer()
+        self.memo = memo if memo is not None else OverflowMemo()
+        # The board after the engine's last move, and the expected line from there on
+        self.played_board = None
+        self.expected_line = []
+        # The position the opponent's move led to, and the variation to seed its search with
+        self.next_root = None
+        self.next_pv = []
+        # Searches in total, searches of a position reached from the engine's last move (whose
+        # subtree the table already covers), and searches where the opponent played the
+        # predicted reply
+        self.searches = 0
+        self.reused = 0
+        self.predicted = 0
+        # The opponent's reply that led to next_root, as a flat index
+        self.last_reply = None
+        # Tree height the last budgeted search reached, or None before the first one; pondered
+        # answers at least this deep are played without searching
+        self.last_height = None
+        # Pondering thread, its stop event, and the best answers found per reply: pondered maps a
+        # reply index to {tree height: (move, principal variation)}
+        self.ponder_thread = None
+        self.ponder_stop = None
+        self.pondered = {}
+        self.ponder_hits = 0
+        # SearchStats of the last search, or None to collect none
+        self.stats = None
+        # OpeningBook consulted before searching, or None
+        self.book = None
+        # Solver tried in endgames before searching, or None
+        self.solver = None
+
+    """
+    Tell the engine which move the opponent played after the engine's last move
+    Parameters:
+        move (tuple): The (row, col) the opponent played.
+        board (Grid): The position after the move, or None to have the engine play it out.
+    """
+
+    def advance(self, move, board=None):
+        self.stop_pondering()
+        self.next_root, self.next_pv, self.last_reply = None, [], None
+        if self.played_board is None:
+            return
+        index = self.played_board.index(*move)
+        if not self.played_board.is_legal(index, -self.player):
+            # The move does not follow from the engine's last move (after an undo, say)
+            return
+        if board is None:
+            board = make_move(self.played_board, index, -self.player)
+        elif not isinstance(board, Grid):
+            board = Grid.from_lists(board)
+        self.next_root = board
+        self.last_reply = index
+        if self.expected_line and self.expected_line[0] == index:
+            self.next_pv = self.expected_line[1:]
+
+    """
+    Choose a move for the board, searching to a fixed tree height or, with a time budget, by
+    iterative deepening
+    Parameters:
+        board (Grid or list of lists): The position to search.
+        tree_height (int): The tree height of a fixed-depth search.
+        time_budget (float): Seconds available for an iterative deepening search, or None.
+        stop (threading.Event): Optional event that cancels the search.
+    Return: the (row, col) of the chosen move, or None if the engine has no move
+    """
+
+    def search(self, board, tree_height=4, time_budget=None, stop=None):
+        self.stop_pondering()
+        if not isinstance(board, Grid):
+            board = Grid.from_lists(board)
+        self.searches += 1
+        pv = []
+        pondered = {}
+        if self.follows_last_move(board):
+            self.reused += 1
+            pv = self.next_pv
+            if pv:
+                self.predicted += 1
+            pondered = self.pondered.get(self.last_reply, {})
+        self.pondered = {}
+        stats = self.stats
+        if stats is not None:
+            stats.reset()
+        start = time.monotonic()
+        known_move = self.known_move(board, time_budget, stop)
+
+        if known_move is not None:
+            move, line = known_move, []
+        elif time_budget is None and tree_height in pondered:
+            # Pondered at exactly this height, so the answer is what the search would return
+            self.ponder_hits += 1
+            move, line = pondered[tree_height]
+        elif (time_budget is not None and pondered and self.last_height is not None
+              and max(pondered) >= self.last_height):
+            # Pondered at least as deep as the last budgeted search got, so the answer is as good
+            # as a search would give
+            self.ponder_hits += 1
+            move, line = pondered[max(pondered)]
+        elif time_budget is not None:
+            # Pondered less deep: the search is seeded with the deepest pondered variation, and
+            # the table pondering filled makes the shallow iterations cheap, so the budget goes
+            # into deeper ones
+            deepest = max(pondered) if pondered else None
+            if deepest is not None:
+                pv = pondered[deepest][1]
+            # The time the book and the solver took comes out of the budget
+            remaining = max(0.0, time_budget - (time.monotonic() - start))
+            tree = iterative_deepening(board, self.player, remaining, self.table,
+                                       orderer=self.orderer, stop=stop, pv=pv, stats=stats,
+                                       memo=self.memo)
+            move, line = tree.get_move(), tree.pv
+            self.last_height = tree.height
+            if deepest is not None and deepest > tree.height:
+                # Pondering got deeper than the search did in its budget
+                move, line = pondered[deepest]
+        else:
+            self.orderer.age()
+            tree = GameTree(board, self.player, tree_height, self.table, pv,
+                            orderer=self.orderer, stop=stop, stats=stats, memo=self.memo)
+            move, line = tree.get_move(), tree.pv
+            if stats is not None:
+                stats.record_iteration(
+                    tree_height, time.monotonic() - start, tree.nodes)
+
+        # Remember where the move leads and which reply the search expects
+        if move is None:
+            self.played_board, self.expected_line = None, []
+        else:
+            self.played_board = make_move(
+                board, board.index(*move), self.player)
+            self.expected_line = line[1:]
+        self.next_root, self.next_pv, self.last_reply = None, [], None
+        return move
+
+    """
+    Return the move for the board from the opening book or, in an endgame, the solver, or None
+    if neither has one
+    Parameters:
+        board (Grid or list of lists): The position.
+        time_budget (float): Seconds available for the move, of which the solver may use
+            SOLVER_SHARE, or None to give the solver its SOLVER_NODES positions whatever they take.
+        stop (threading.Event): Optional event that cancels the solver with SearchCancelled.
+    """
+
+    def known_move(self, board, time_budget=None, stop=None):
+        if not isinstance(board, Grid):
+            board = Grid.from_lists(board)
+        move = self.book_move(board)
+        if move is None:
+            deadline = None
+            if time_budget is not None:
+                deadline = time.monotonic() + time_budget * SOLVER_SHARE
+            move = self.solved_move(board, deadline, stop)
+        return move
+
+    """
+    Return the opening book's move for the board, or None if there is no book or the position
+    is not in it
+    """
+
+    def book_move(self, board):
+        if self.book is None:
+            return None
+        if not isinstance(board, Grid):
+            board = Grid.from_lists(board)
+        return self.book.lookup(board, self.player)
+
+    """
+    Return a move the solver proves wins the board, or None if there is no solver, the board is
+    not an endgame or no win is proven within SOLVER_NODES expanded positions or by the deadline
+    (a time.monotonic() value, or None). Setting the stop event cancels the solver with
+    SearchCancelled.
+    """
+
+    def solved_move(self, board, deadline=None, stop=None):
+        if self.solver is None:
+            return None
+        if not isinstance(board, Grid):
+            board = Grid.from_lists(board)
+        if not is_endgame(board):
+            return None
+        result, move = self.solver.solve(board, self.player, SOLVER_NODES, deadline, stop)
+        return move if result == WIN else None
+
+    """
+    Start pondering the opponent's replies to the engine's last move in a background thread
+    Parameters:
+        replies (int): How many of the most likely replies to ponder.
+    """
+
+    def start_pondering(self, replies=PONDER_REPLIES):
+        self.stop_pondering()
+        if self.played_board is None:
+            return
+        self.ponder_stop = threading.Event()
+        self.ponder_thread = threading.Thread(target=self.ponder, args=(self.ponder_stop, replies),
+                                              daemon=True)
+        self.ponder_thread.start()
+
+    """
+    Stop pondering and wait for the pondering thread to finish
+    """
+
+    def stop_pondering(self):
+        if self.ponder_thread is not None:
+            self.ponder_stop.set()
+            self.ponder_thread.join()
+            self.ponder_thread = None
+            self.ponder_stop = None
+
+    # Search the likely replies one tree height at a time until stopped or out of depth
+    def ponder(self, stop, replies):
+        candidates = self.likely_replies(replies)
+        for height in range(2, MAX_TREE_HEIGHT + 1):
+            for index, board in candidates:
+                pondered = self.pondered.setdefault(index, {})
+                seed = pondered[height - 1][1] if height - 1 in pondered else []
+                try:
+                    tree = GameTree(board, self.player, height, self.table, seed,
+                                    orderer=self.orderer, stop=stop, memo=self.memo)
+                except SearchCancelled:
+                    return
+                if tree.get_move() is not None:
+                    pondered[height] = (tree.get_move(), tree.pv)
+
+    # Return (reply index, resulting board) for the opponent's most likely replies: the predicted
+    # reply first, then the replies that look best for the opponent after one move
+    def likely_replies(self, count):
+        moves = generate_moves(self.played_board, -self.player)
+        # Every reply is scored, so the siblings are played and scored in one batch
+        scores = score_moves(self.played_board, moves, -self.player, -self.player)
+        predicted = self.expected_line[0] if self.expected_line else None
+        scored = sorted(((index == predicted, score, -index) for index, score in zip(moves, scores)),
+                        reverse=True)
+        return [(-entry[2], make_move(self.played_board, -entry[2], -self.player))
+                for entry in scored[:count]]
+
+    # Return whether the board is the position after the engine's last move and one opponent
+    # move. If advance() was not called, the opponent's move is worked out from the board.
+    def follows_last_move(self, board):
+        if self.next_root is None and self.played_board is not None:
+            for index in generate_moves(self.played_board, -self.player):
+                if make_move(self.played_board, index, -self.player) == board:
+                    self.advance(divmod(index, board.width), board)
+                    break
+        return self.next_root is not None and self.next_root == board
+
+    """
+    Return the fraction of searches that started from a position reached from the engine's
+    last move
+    """
+
+    def reuse_rate(self):
+        return self.reused / self.searches if self.searches else 0.0
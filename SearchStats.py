@@ -0,0 +1,114 @@
+# Statistics collected by a search that is given a SearchStats object.
+# GameTree only touches the counters when it has one, so a search without statistics pays one
+# `is not None` test at each counting point and nothing else.
+class SearchStats:
+    def __init__(self):
+        self.reset()
+
+    """
+    Zero every counter, before a new search
+    Runtime: O(1)
+    """
+
+    def reset(self):
+        # Positions visited (leaves included), leaves scored and positions whose moves were
+        # generated
+        self.nodes = 0
+        self.leaves = 0
+        self.expanded = 0
+        # Moves played below expanded positions, and the overflow waves they set off
+        self.moves = 0
+        self.waves = 0
+        # Beta cutoffs per ply of the search
+        self.cutoffs = []
+        # Transposition table lookups and how many found their position
+        self.table_probes = 0
+        self.table_hits = 0
+        # (tree height, seconds, nodes) of every completed iteration
+        self.iterations = []
+
+    """
+    Count a beta cutoff at the given ply
+    Runtime: O(1) amortized
+    """
+
+    def record_cutoff(self, depth):
+        while len(self.cutoffs) <= depth:
+            self.cutoffs.append(0)
+        self.cutoffs[depth] += 1
+
+    """
+    Record a completed iteration of the search
+    Parameters:
+        height (int): The tree height of the iteration.
+        seconds (float): How long the iteration took.
+        nodes (int): The positions the iteration visited.
+    """
+
+    def record_iteration(self, height, seconds, nodes):
+        self.iterations.append((height, seconds, nodes))
+
+    """
+    Return the average number of moves searched per expanded position
+    Runtime: O(1)
+    """
+
+    def branching_factor(self):
+        return self.moves / self.expanded if self.expanded else 0.0
+
+    """
+    Return how many times more nodes the last iteration visited than the one before it, or
+    0.0 with fewer than two iterations
+    Runtime: O(1)
+    """
+
+    def effective_branching_factor(self):
+        if len(self.iterations) < 2 or not self.iterations[-2][2]:
+            return 0.0
+        return self.iterations[-1][2] / self.iterations[-2][2]
+
+    """
+    Return the fraction of table lookups that found their position
+    Runtime: O(1)
+    """
+
+    def table_hit_rate(self):
+        return self.table_hits / self.table_probes if self.table_probes else 0.0
+
+    """
+    Return the statistics as a dictionary
+    Runtime: O(p + i) where p is the number of plies and i the number of iterations
+    """
+
+    def as_dict(self):
+        return {
+            "nodes": self.nodes,
+            "leaves": self.leaves,
+            "expanded": self.expanded,
+            "moves": self.moves,
+            "waves": self.waves,
+            "cutoffs": list(self.cutoffs),
+            "table_probes": self.table_probes,
+            "table_hits": self.table_hits,
+            "iterations": list(self.iterations),
+            "branching_factor": self.branching_factor(),
+            "effective_branching_factor": self.effective_branching_factor(),
+        }
+
+    """
+    Return the statistics as short lines of text, for display
+    """
+
+    def summary(self):
+        seconds = sum(iteration[1] for iteration in self.iterations)
+        return [
+            "Nodes: {} ({} leaves)".format(self.nodes, self.leaves),
+            "Depth: {}  Time: {:.2f}s".format(
+                max(0, self.iterations[-1][0] - 1) if self.iterations else 0, seconds),
+            "Nodes/s: {:.0f}".format(self.nodes / seconds if seconds > 0 else 0.0),
+            "Cutoffs: {}".format(" ".join(str(count) for count in self.cutoffs)),
+            "Overflow waves: {}".format(self.waves),
+            "Table hits: {:.0%}".format(self.table_hit_rate()),
+            "Branching: {:.1f} (eff. {:.1f})".format(
+                self.branching_factor(), self.effective_branching_factor()),
+        ]
@@ -0,0 +1,297 @@
+import os
+import struct
+import tempfile
+import time
+
+from Grid import Grid
+from GameTree import SearchCancelled, generate_moves, make_move
+from MonteCarloTree import get_winner
+from TranspositionTable import PLAYER_KEYS
+
+# Results of a solved position, for the player to move
+WIN = 1
+LOSS = -1
+UNKNOWN = 0
+
+# Proof and disproof number of a position that can no longer be proven (or disproven)
+INFINITY = float("inf")
+
+# Where solved positions are kept between runs
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "solver_cache.bin")
+
+# Cache file layout: a header (magic, number of entries) followed by the entries. Each entry is
+# the board rows and cols, its wave cap (0 for none), the 64-bit solver key (see solver_key), the
+# result and the flat index of the winning move, NO_MOVE for a loss. The file only holds plain
+# numbers, so loading a cache never runs code from it.
+CACHE_MAGIC = b"SLV2"
+CACHE_HEADER = struct.Struct("<4sI")
+CACHE_ENTRY = struct.Struct("<HHHQbH")
+NO_MOVE = 0xFFFF
+
+# Boards with at most this many cells are small enough to solve from any position
+SMALL_BOARD_CELLS = 16
+# On bigger boards the solver is only tried once at most this fraction of the cells is left
+# empty, when the players are fighting over a full board and cascades decide the game
+ENDGAME_EMPTY = 1 / 6
+# Boards with more cells than this are never solved: every position has about as many moves as
+# the board has cells, so the search could not get anywhere in its node budget
+SOLVER_MAX_CELLS = 100
+
+# The SolverCache of each cache file, shared by every solver in the process (see shared_cache)
+SHARED_CACHES = {}
+
+
+"""
+Returns the key a position is cached under: the board's Zobrist key mixed with the player to move.
+"""
+
+
+def solver_key(board, player):
+    return board.zobrist_key() ^ PLAYER_KEYS[player]
+
+
+"""
+Returns the key of a position in a SolverCache: the board size, its wave cap (0 for none), which
+changes who wins a position, and the solver key.
+"""
+
+
+def cache_key(board, player):
+    return (board.height, board.width, board.max_waves or 0, solver_key(board, player))
+
+
+"""
+Returns whether the solver is worth trying on the board: every position of a small board, and
+on bigger boards (up to SOLVER_MAX_CELLS) the positions where few cells are left empty.
+"""
+
+
+def is_endgame(board):
+    if board.size <= SMALL_BOARD_CELLS:
+        return True
+    if board.size > SOLVER_MAX_CELLS:
+        return False
+    return board.cells.count(0) <= board.size * ENDGAME_EMPTY
+
+
+# A position of the proof-number search tree. proof and disproof are the number of positions
+# that still have to be solved to prove, or disprove, that the root player wins from here.
+class ProofNode:
+    __slots__ = ("board", "player", "move", "parent", "children", "proof", "disproof")
+
+    def __init__(self, board, player, move=None, parent=None):
+        self.board = board
+        self.player = player
+        self.move = move
+        self.parent = parent
+        self.children = None
+        self.proof = 1
+        self.disproof = 1
+
+
+# Solved positions with their result and winning move, saved to disk between runs.
+# Entries map cache_key to (result, move), where result is WIN or LOSS for the
+# player to move and move is the flat index of a winning move (None for a loss).
+# Solvers in the same process should share one cache per file (see shared_cache), and saving
+# merges the entries with the ones already in the file, so caches in other processes, such as
+# the Arena's workers, do not undo each other's work.
+class SolverCache:
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self.entries = self.load()
+        self.dirty = False
+
+    """
+    Return the entries in the cache file, or no entries if there is no file
+    """
+
+    def load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return {}
+        with open(self.path, "rb") as file:
+            data = file.read()
+        if len(data) < CACHE_HEADER.size:
+            raise ValueError("{} is not a solver cache".format(self.path))
+        magic, count = CACHE_HEADER.unpack_from(data, 0)
+        if magic != CACHE_MAGIC or len(data) != CACHE_HEADER.size + count * CACHE_ENTRY.size:
+            raise ValueError("{} is not a solver cache".format(self.path))
+        entries = {}
+        for rows, cols, waves, key, result, move in CACHE_ENTRY.iter_unpack(
+                data[CACHE_HEADER.size:]):
+            entries[(rows, cols, waves, key)] = (result, None if move == NO_MOVE else move)
+        return entries
+
+    """
+    Return the (result, move) of a solved position, or None if it has not been solved
+    Runtime: O(1)
+    """
+
+    def get(self, board, player):
+        return self.entries.get(cache_key(board, player))
+
+    """
+    Record a solved position
+    Runtime: O(1)
+    """
+
+    def put(self, board, player, result, move):
+        self.entries[cache_key(board, player)] = (result, move)
+        self.dirty = True
+
+    """
+    Write the cache to its file if anything was added since it was loaded or last saved. The
+    entries saved in the meantime by other caches of the same file are merged in first. The file
+    is written under a temporary name of its own and replaced in one step, so a crash never
+    leaves half a cache behind and processes saving at the same time do not write over each
+    other's temporary files.
+    """
+
+    def save(self):
+        if self.path is None or not self.dirty:
+            return
+        entries = self.load()
+        entries.update(self.entries)
+        directory, name = os.path.split(self.path)
+        descriptor, temporary = tempfile.mkstemp(prefix=name + ".", suffix=".tmp", dir=directory)
+        try:
+            # mkstemp makes the file readable by its owner only; the cache is not secret
+            os.chmod(temporary, 0o644)
+            with os.fdopen(descriptor, "wb") as file:
+                file.write(CACHE_HEADER.pack(CACHE_MAGIC, len(entries)))
+                for (rows, cols, waves, key), (result, move) in entries.items():
+                    file.write(CACHE_ENTRY.pack(rows, cols, waves, key, result,
+                                                NO_MOVE if move is None else move))
+            os.replace(temporary, self.path)
+        except BaseException:
+            os.remove(temporary)
+            raise
+        self.entries = entries
+        self.dirty = False
+
+
+"""
+Returns the SolverCache of the file at path that every solver in the process shares, loading it
+the first time it is asked for.
+"""
+
+
+def shared_cache(path=CACHE_PATH):
+    if path not in SHARED_CACHES:
+        SHARED_CACHES[path] = SolverCache(path)
+    return SHARED_CACHES[path]
+
+
+# Proves the game-theoretic value of positions with proof-number search.
+# The root player's turns are OR nodes (one winning move is enough) and the opponent's turns are
+# AND nodes (every reply has to lose). The search always expands the most proving position: the
+# one whose result would bring the root closest to being proven or disproven. A game only ends
+# when a player loses their last cell and repeated positions are not draws, so every line of a
+# proof ends in a win and the proof holds even where the tree reaches a position twice.
+#
+# Every position the search proves is added to the cache, and positions already in the cache are
+# not searched again.
+class Solver:
+    def __init__(self, cache=None):
+        self.cache = cache if cache is not None else SolverCache(None)
+        self.nodes = 0
+
+    """
+    Solve a position
+    Parameters:
+        board (Grid or list of lists): The position.
+        player (int): The player to move.
+        max_nodes (int): How many positions the search may expand before giving up.
+        deadline (float): time.monotonic() value after which the search gives up, or None.
+        stop (threading.Event): Optional event that cancels the search with SearchCancelled.
+    Return: a (result, move) tuple: WIN, LOSS or UNKNOWN for the player to move, and the
+        (row, col) of a winning move when the result is WIN
+    """
+
+    def solve(self, board, player, max_nodes=100000, deadline=None, stop=None):
+        if not isinstance(board, Grid):
+            board = Grid.from_lists(board)
+        cached = self.cache.get(board, player)
+        if cached is not None:
+            return cached[0], self.to_move(board, cached[1])
+
+        root = ProofNode(board, player)
+        self.nodes = 0
+        while root.proof != 0 and root.disproof != 0 and self.nodes < max_nodes:
+            if stop is not None and stop.is_set():
+                raise SearchCancelled()
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            node = root
+            while node.children:
+                node = self.most_proving_child(node, player)
+            self.expand(node, player)
+            self.update_ancestors(node, player)
+
+        if root.proof == 0:
+            move = next(child.move for child in root.children if child.proof == 0)
+            return WIN, self.to_move(board, move)
+        if root.disproof == 0:
+            return LOSS, None
+        return UNKNOWN, None
+
+    # Return the child to follow towards the most proving position
+    def most_proving_child(self, node, root_player):
+        if node.player == root_player:
+            return min(node.children, key=lambda child: child.proof)
+        return min(node.children, key=lambda child: child.disproof)
+
+    # Generate the children of a position and give each one its proof and disproof numbers
+    def expand(self, node, root_player):
+        self.nodes += 1
+        node.children = []
+        for index in generate_moves(node.board, node.player):
+            child = ProofNode(make_move(node.board, index, node.player), -node.player, index, node)
+            winner = get_winner(child.board)
+            if not winner:
+                cached = self.cache.get(child.board, child.player)
+                if cached is not None:
+                    winner = child.player if cached[0] == WIN else -child.player
+            if winner == root_player:
+                child.proof, child.disproof = 0, INFINITY
+            elif winner:
+                child.proof, child.disproof = INFINITY, 0
+            node.children.append(child)
+        if not node.children:
+            # No legal move: the player to move cannot make progress, count it as a loss
+            if node.player == root_player:
+                node.proof, node.disproof = INFINITY, 0
+            else:
+                node.proof, node.disproof = 0, INFINITY
+
+    # Recompute the proof and disproof numbers from the node up to the root, caching every
+    # position that becomes solved on the way
+    def update_ancestors(self, node, root_player):
+        while node is not None:
+            if node.children:
+                if node.player == root_player:
+                    node.proof = min(child.proof for child in node.children)
+                    node.disproof = sum(child.disproof for child in node.children)
+                else:
+                    node.proof = sum(child.proof for child in node.children)
+                    node.disproof = min(child.disproof for child in node.children)
+            if node.proof == 0 or node.disproof == 0:
+                self.store(node, root_player)
+            node = node.parent
+
+    # Cache a solved position from the point of view of its player to move
+    def store(self, node, root_player):
+        root_wins = node.proof == 0
+        if root_wins == (node.player == root_player):
+            # The player to move wins; find the move that does it
+            move = None
+            for child in node.children or ():
+                if (child.proof if root_wins else child.disproof) == 0:
+                    move = child.move
+                    break
+            if move is not None:
+                self.cache.put(node.board, node.player, WIN, move)
+        else:
+            self.cache.put(node.board, node.player, LOSS, None)
+
+    def to_move(self, board, index):
+        return divmod(index, board.width) if index is not None else None
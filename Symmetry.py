@@ -0,0 +1,98 @@
+from hashlib import blake2b
+
+# A board looks the same to the players after mirroring its rows, mirroring its columns or
+# turning it by 180 degrees (see Topology.symmetry_table), and after swapping the colours of all
+# gems together with the player to move. Positions related by these transforms have the same
+# value and corresponding best moves.
+#
+# The canonical form of a position swaps colours so that the player to move owns the positive
+# cells, then takes the smallest of the four spatial transforms of the cells. A transform is
+# given as a (symmetry number, colours swapped) pair.
+
+"""
+Returns the canonical form of a position.
+
+Parameters:
+    board (Grid): The position.
+    player (int): The player to move.
+
+Returns:
+    tuple: (cells, transform) where cells are the canonical cell bytes and transform the
+        (symmetry number, colours swapped) pair that turns the board into them.
+"""
+
+
+def canonical_form(board, player):
+    cells = board.cells
+    best, best_symmetry = None, 0
+    for symmetry, permutation in enumerate(board.topology.symmetry_table()):
+        # The cell at index goes to permutation[index]; as the permutation is its own inverse,
+        # the transformed board holds cells[permutation[index]] at index
+        form = bytes((cells[source] * player) & 0xFF for source in permutation)
+        if best is None or form < best:
+            best, best_symmetry = form, symmetry
+    return best, (best_symmetry, player == -1)
+
+
+"""
+Returns a 64-bit key shared by every position that is equivalent to the board, and the
+transform that takes the board to its canonical form. The key does not depend on the process or
+the run, so it can be stored in files.
+
+Parameters:
+    board (Grid): The position.
+    player (int): The player to move.
+
+Returns:
+    tuple: (key, transform).
+"""
+
+
+def canonical_key(board, player):
+    form, transform = canonical_form(board, player)
+    digest = blake2b(form, digest_size=8, person=b"%dx%d" % (board.height, board.width))
+    return int.from_bytes(digest.digest(), "little"), transform
+
+
+"""
+Returns where the cell at a flat index goes under a transform. Every transform is its own
+inverse, so this also maps a cell of the canonical form back to the board.
+"""
+
+
+def transform_index(board, transform, index):
+    return board.topology.symmetry_table()[transform[0]][index]
+
+
+"""
+Returns the symmetries (other than the identity) that leave the board and its colours unchanged.
+"""
+
+
+def get_board_symmetries(board):
+    cells = board.cells
+    return [permutation for permutation in board.topology.symmetry_table()[1:]
+            if all(cells[permutation[index]] == cell for index, cell in enumerate(cells))]
+
+
+"""
+Removes the moves that are symmetric to a move earlier in row-major order. When a symmetry
+leaves the board unchanged, a move and its mirror image lead to equivalent positions with the
+same value, and a search that picks the first best move in row-major order never needs the
+later one.
+
+Parameters:
+    board (Grid): The position the moves are played on.
+    moves (list): Flat indices of the moves.
+
+Returns:
+    list: The moves that are the first of their kind, in their original order.
+"""
+
+
+def unique_moves(board, moves):
+    symmetries = get_board_symmetries(board)
+    if not symmetries:
+        return moves
+    return [index for index in moves
+            if all(permutation[index] >= index for permutation in symmetries)]
@@ -0,0 +1,123 @@
+import random
+
+from Overflow import get_neighbours, get_neighbours_count
+
+# How far past its threshold a cell can get in play: a cell one short of its threshold gains a gem
+# from each of its four neighbours in one wave, and a cell a capped cascade left overflowing can
+# then gain one more gem from a move before it overflows
+MAX_OVERSHOOT = 4
+
+
+# Per-board-size lookup tables used by the overflow engine and the board evaluation.
+# Everything that only depends on where a cell sits on the board (corner, edge or interior)
+# is worked out once here, so the hot loops only do table lookups by flat index.
+class Topology:
+    def __init__(self, rows, cols):
+        self.rows = rows
+        self.cols = cols
+        self.size = rows * cols
+
+        coordinates = []
+        neighbours = []
+        thresholds = []
+        areas = []
+        position_scores = []
+        potential_divisors = []
+        for row in range(rows):
+            for col in range(cols):
+                coordinates.append((row, col))
+                # Orthogonal neighbours, in the order overflow feeds them
+                neighbours.append(tuple(n_row * cols + n_col for n_row, n_col in
+                                        get_neighbours(row, col, rows, cols)))
+                # A cell overflows once it holds as many gems as this
+                thresholds.append(get_neighbours_count(row, col, rows, cols))
+                # The 3x3 neighbourhood (including the cell itself) scanned by the evaluation
+                areas.append(tuple((row + i) * cols + col + j
+                                   for i in range(-1, 2) for j in range(-1, 2)
+                                   if 0 <= row + i < rows and 0 <= col + j < cols))
+                # Corners are more valuable, edges have intermediate value, center cells the least
+                on_row_edge = row in [0, rows - 1]
+                on_col_edge = col in [0, cols - 1]
+                if on_row_edge and on_col_edge:
+                    position_scores.append(5)
+                elif on_row_edge or on_col_edge:
+                    position_scores.append(3)
+                else:
+                    position_scores.append(1)
+                potential_divisors.append(
+                    max(1, 4 - on_row_edge - on_col_edge))
+
+        self.coordinates = tuple(coordinates)
+        self.neighbours = tuple(neighbours)
+        self.thresholds = tuple(thresholds)
+        self.areas = tuple(areas)
+        self.position_scores = tuple(position_scores)
+        self.potential_divisors = tuple(potential_divisors)
+        # Whether every cell score is a multiple of 0.25 for any cell value a Grid can hold.
+        # Sums of such scores are exact in floating point, so they do not depend on the order
+        # the scores are added in.
+        self.exact_scores = all(((value / divisor) * position_score * 4).is_integer()
+                                for divisor, position_score in set(zip(self.potential_divisors, self.position_scores))
+                                for value in range(128))
+        # Cell values from -max_value to max_value get distinct Zobrist keys
+        self.max_value = max(thresholds) + MAX_OVERSHOOT
+        self.zobrist_values = 2 * self.max_value + 1
+        self.zobrist = None
+        self.symmetries = None
+
+    """
+    Returns the Zobrist table for this board size, building it on first use. zobrist[index]
+    holds one random 64-bit key per cell value (indexed by value % zobrist_values), and empty
+    cells always hash to 0. Every value a cell can reach in play has a key of its own; values
+    further out, which only hand-built positions hold, share keys. The keys are seeded from the
+    board size, so they are the same in every process and every run.
+    """
+
+    def zobrist_table(self):
+        if self.zobrist is None:
+            rng = random.Random("zobrist {}x{}".format(self.rows, self.cols))
+            self.zobrist = tuple(
+                (0,) + tuple(rng.getrandbits(64)
+                             for _ in range(self.zobrist_values - 1))
+                for _ in range(self.size))
+        return self.zobrist
+
+    """
+    Returns the symmetries of the board shape, building them on first use: one permutation of
+    the flat indices each for the identity, mirroring the rows (top to bottom), mirroring the
+    columns (left to right) and the 180 degree rotation. symmetries[n][index] is where the
+    cell at index goes. Each of them is its own inverse, so the same permutation also maps
+    back.
+    """
+
+    def symmetry_table(self):
+        if self.symmetries is None:
+            rows, cols = self.rows, self.cols
+            self.symmetries = tuple(
+                tuple((rows - 1 - row if flip_rows else row) * cols +
+                      (cols - 1 - col if flip_cols else col)
+                      for row in range(rows) for col in range(cols))
+                for flip_rows, flip_cols in ((False, False), (True, False), (False, True),
+                                             (True, True)))
+        return self.symmetries
+
+
+_topologies = {}
+
+"""
+Returns the shared topology for a board size, building it on first use.
+
+Parameters:
+    rows (int): Number of rows of the board.
+    cols (int): Number of columns of the board.
+
+Returns:
+    Topology: The cached topology for (rows, cols).
+"""
+
+
+def get_topology(rows, cols):
+    topology = _topologies.get((rows, cols))
+    if topology is None:
+        topology = _topologies[(rows, cols)] = Topology(rows, cols)
+    return topology
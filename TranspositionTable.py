@@ -0,0 +1,171 @@
+import random
+
+from Symmetry import canonical_key
+
+# Bound types of a stored score
+EXACT = 0
+LOWER = 1  # The real score is at least the stored score (the search failed high)
+UPPER = 2  # The real score is at most the stored score (the search failed low)
+
+# Rough size of one stored entry (the tuple and its ints), used to turn a memory cap into a
+# number of slots
+ENTRY_BYTES = 128
+
+# Keys mixed into a board's Zobrist key so that the same cells with a different player to move,
+# or searched from the other player's point of view, are different positions
+_rng = random.Random("transposition table")
+PLAYER_KEYS = {1: _rng.getrandbits(64), -1: _rng.getrandbits(64)}
+PERSPECTIVE_KEYS = {1: _rng.getrandbits(64), -1: _rng.getrandbits(64)}
+
+"""
+Returns the transposition table key of a search position.
+
+Parameters:
+    board (Grid): The position; its Zobrist key is tracked from here on.
+    player (int): The player to move.
+    perspective (int): The player the search evaluates the position for.
+
+Returns:
+    int: A 64-bit key.
+"""
+
+
+def position_key(board, player, perspective):
+    return board.zobrist_key() ^ PLAYER_KEYS[player] ^ PERSPECTIVE_KEYS[perspective]
+
+
+"""
+Returns the transposition table key shared by a search position and every position equivalent
+to it under the board symmetries and a colour swap (see Symmetry), together with the permutation
+that maps moves between the position and the shared frame in both directions. Searches from
+either player's point of view give equivalent positions equal scores, so only whether the
+position is evaluated for the player to move or for the other one goes into the key.
+
+Parameters:
+    board (Grid): The position.
+    player (int): The player to move.
+    perspective (int): The player the search evaluates the position for.
+
+Returns:
+    tuple: (key, permutation).
+"""
+
+
+def canonical_position_key(board, player, perspective):
+    key, transform = canonical_key(board, player)
+    return (key ^ PERSPECTIVE_KEYS[perspective * player],
+            board.topology.symmetry_table()[transform[0]])
+
+
+# Fixed-size transposition table of search results keyed by 64-bit Zobrist keys.
+# Each bucket has two slots: a depth-preferred slot that keeps the deepest result seen for that
+# bucket, and an always-replace slot that takes whatever the depth-preferred slot refused.
+# Entries are (key, depth, score, bound, move) tuples.
+#
+# A symmetric table shares its entries between equivalent positions (see canonical_position_key).
+# Its keys take O(n) to compute instead of O(1), so it pays off where symmetric positions are
+# common, such as the opening.
+class TranspositionTable:
+    def __init__(self, max_bytes=16 * 1024 * 1024, symmetric=False):
+        self.symmetric = symmetric
+        # Use the largest power of two of buckets that fits in the memory cap
+        buckets = 1
+        while buckets * 4 * ENTRY_BYTES <= max_bytes:
+            buckets *= 2
+        self.mask = buckets - 1
+        self.deep_slots = [None] * buckets
+        self.recent_slots = [None] * buckets
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.replacements = 0
+
+    """
+    Return the number of entries the table can hold
+    Runtime: O(1)
+    """
+
+    def capacity(self):
+        return 2 * len(self.deep_slots)
+
+    """
+    Look up a key. An entry searched to exactly the given depth is preferred over one of
+    another depth for the same key.
+    Return: the matching (key, depth, score, bound, move) entry, or None
+    Runtime: O(1)
+    """
+
+    def probe(self, key, depth):
+        self.probes += 1
+        bucket = key & self.mask
+        deep = self.deep_slots[bucket]
+        recent = self.recent_slots[bucket]
+        if deep is not None and deep[0] == key:
+            if deep[1] != depth and recent is not None and recent[0] == key and recent[1] == depth:
+                deep = recent
+            self.hits += 1
+            return deep
+        if recent is not None and recent[0] == key:
+            self.hits += 1
+            return recent
+        return None
+
+    """
+    Store a search result. The depth-preferred slot is only overwritten by a result that is
+    at least as deep; anything else goes to the always-replace slot.
+    Runtime: O(1)
+    """
+
+    def store(self, key, depth, score, bound, move):
+        self.stores += 1
+        bucket = key & self.mask
+        entry = (key, depth, score, bound, move)
+        deep = self.deep_slots[bucket]
+        if deep is None or depth >= deep[1]:
+            if deep is not None and deep[0] != key:
+                # Demote the old deep entry rather than losing it
+                self.replace_recent(bucket, deep)
+            self.deep_slots[bucket] = entry
+        else:
+            self.replace_recent(bucket, entry)
+
+    def replace_recent(self, bucket, entry):
+        if self.recent_slots[bucket] is not None:
+            self.replacements += 1
+        self.recent_slots[bucket] = entry
+
+    """
+    Return the fraction of probes that found their key
+    Runtime: O(1)
+    """
+
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    """
+    Return the table's counters as a dictionary
+    Runtime: O(1)
+    """
+
+    def stats(self):
+        return {
+            "capacity": self.capacity(),
+            "probes": self.probes,
+            "hits": self.hits,
+            "hit_rate": self.hit_rate(),
+            "stores": self.stores,
+            "replacements": self.replacements,
+        }
+
+    """
+    Remove every entry and reset the counters
+    Runtime: O(n) where n is the capacity of the table
+    """
+
+    def clear(self):
+        self.deep_slots = [None] * len(self.deep_slots)
+        self.recent_slots = [None] * len(self.recent_slots)
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.replacements = 0
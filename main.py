@@ -5,11 +5,16 @@
 import pygame
 import sys
 import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from Overflow import overflow
+from Grid import Grid
 from SimpleQueue import Queue
 from Player1 import PlayerOne
 from Player2 import PlayerTwo
+from PlayerMCTS import PlayerMCTS
 
 
 class Dropdown:
@@ -40,26 +45,24 @@ class Dropdown:
 
 
 class Board:
-    def __init__(self, width, height, p1_sprites, p2_sprites):
+    def __init__(self, width, height, p1_sprites, p2_sprites, max_waves=None):
         self.width = width
         self.height = height
-        self.game_board = [[0 for _ in range(width)] for _ in range(height)]
+        self.game_board = Grid(height, width, max_waves=max_waves)
         self.p1_sprites = p1_sprites
         self.p2_sprites = p2_sprites
-        self.game_board[0][0] = 1
-        self.game_board[self.height-1][self.width-1] = -1
+        self.game_board.set(0, 0, 1)
+        self.game_board.set(self.height-1, self.width-1, -1)
         self.turn = 0
         self.previous_board_p1 = None  # For undo for player 1
         self.previous_board_p2 = None  # For undo for player 2
 
     def get_board(self):
-        current_board = []
-        for i in range(self.height):
-            current_board.append(self.game_board[i].copy())
-        return current_board
+        return self.game_board.clone()
 
     def valid_move(self, row, col, player):
-        if row >= 0 and row < self.height and col >= 0 and col < self.width and (self.game_board[row][col] == 0 or self.game_board[row][col]/abs(self.game_board[row][col]) == player):
+        # The board keeps a bitset of each player's legal cells
+        if row >= 0 and row < self.height and col >= 0 and col < self.width and self.game_board.is_legal(self.game_board.index(row, col), player):
             return True
         return False
 
@@ -71,91 +74,98 @@ class Board:
             elif player == -1:
                 self.previous_board_p2 = self.get_board()
             # If the move is valid, add the piece to the board
-            self.game_board[row][col] += player
+            self.game_board.set(row, col, self.game_board.get(row, col) + player)
             # Increment the turn counter
             self.turn += 1
             return True
         return False
 
     def check_win(self):
+        # The board keeps count of each player's cells, so no scan is needed
         if (self.turn > 0):
-            num_p1 = 0
-            num_p2 = 0
-            for i in range(self.height):
-                for j in range(self.width):
-                    if (self.game_board[i][j] > 0):
-                        if num_p2 > 0:
-                            return 0
-                        num_p1 += 1
-                    elif (self.game_board[i][j] < 0):
-                        if num_p1 > 0:
-                            return 0
-                        num_p2 += 1
-            if (num_p1 == 0):
+            if self.game_board.positive_cells > 0 and self.game_board.negative_cells > 0:
+                return 0
+            if (self.game_board.positive_cells == 0):
                 return -1
-            if (num_p2 == 0):
-                return 1
+            return 1
         return 0
 
     def do_overflow(self, q):
-        oldboard = []
-        for i in range(self.height):
-            oldboard.append(self.game_board[i].copy())
-        numsteps = overflow(self.game_board, q)
-        if (numsteps != 0):
-            self.set(oldboard)
-        return numsteps
+        # Run the overflow on a copy so the board only changes as the animation replays
+        # the changed cells recorded for each wave
+        board = self.get_board()
+        waves = overflow(board, q)
+        # The animation only replays the cell values, so keep the cells a capped overflow left
+        # overflowing for the next move's overflow to start from
+        self.game_board.pending = board.pending
+        return waves
 
     def set(self, newboard):
-        for row in range(self.height):
-            for col in range(self.width):
-                self.game_board[row][col] = newboard[row][col]
+        self.game_board.cells[:] = newboard.cells
+        self.game_board.recount()
+        self.game_board.pending = newboard.pending
+
+    def apply_changes(self, changes):
+        for row, col, value in changes:
+            self.game_board.set(row, col, value)
 
     def draw(self, window, frame):
-        for row in range(GRID_SIZE[0]):
-            for col in range(GRID_SIZE[1]):
-                rect = pygame.Rect(col * CELL_SIZE + X_OFFSET,
-                                   row * CELL_SIZE+Y_OFFSET, CELL_SIZE, CELL_SIZE)
-                pygame.draw.rect(window, BLACK, rect, 1)
-        for row in range(self.height):
-            for col in range(self.width):
-                if self.game_board[row][col] != 0:
-                    rpos = row * CELL_SIZE + Y_OFFSET
-                    cpos = col * CELL_SIZE + X_OFFSET
-                    if self.game_board[row][col] > 0:
-                        sprite = p1_sprites
-                    else:
-                        sprite = p2_sprites
-                    if abs(self.game_board[row][col]) == 1:
-                        cpos += CELL_SIZE // 2 - 16
-                        rpos += CELL_SIZE // 2 - 16
-                        window.blit(sprite[math.floor(frame)], (cpos, rpos))
-                    elif abs(self.game_board[row][col]) == 2:
-                        cpos += CELL_SIZE // 2 - 32
-                        rpos += CELL_SIZE // 2 - 16
-                        window.blit(sprite[math.floor(frame)], (cpos, rpos))
-                        cpos += 32
-                        window.blit(sprite[math.floor(frame)], (cpos, rpos))
-
-                    elif abs(self.game_board[row][col]) == 3:
-                        cpos += CELL_SIZE // 2 - 16
-                        rpos += 8
-                        window.blit(sprite[math.floor(frame)], (cpos, rpos))
-                        cpos = col * CELL_SIZE + X_OFFSET + CELL_SIZE // 2 - 32
-                        rpos += CELL_SIZE // 2
-                        window.blit(sprite[math.floor(frame)], (cpos, rpos))
-                        cpos += 32
-                        window.blit(sprite[math.floor(frame)], (cpos, rpos))
-                    elif abs(self.game_board[row][col]) == 4:
-                        cpos += CELL_SIZE // 2 - 32
-                        rpos += 8
-                        window.blit(sprite[math.floor(frame)], (cpos, rpos))
-                        rpos += CELL_SIZE // 2
-                        window.blit(sprite[math.floor(frame)], (cpos, rpos))
-                        cpos += 32
-                        window.blit(sprite[math.floor(frame)], (cpos, rpos))
-                        rpos -= CELL_SIZE // 2
-                        window.blit(sprite[math.floor(frame)], (cpos, rpos))
+        # Cell outlines, left out when the cells are too small for them to leave any room
+        if CELL_SIZE >= MIN_OUTLINED_CELL:
+            for row in range(GRID_SIZE[0]):
+                for col in range(GRID_SIZE[1]):
+                    rect = pygame.Rect(col * CELL_SIZE + X_OFFSET,
+                                       row * CELL_SIZE+Y_OFFSET, CELL_SIZE, CELL_SIZE)
+                    pygame.draw.rect(window, BLACK, rect, 1)
+        # Gem sprites and their spacing scale with the cells (32 pixel gems in 100 pixel cells)
+        gem = GEM_SIZE
+        half = gem // 2
+        margin = CELL_SIZE * 8 // 100
+        # Only the occupied cells have anything to draw
+        for index in self.game_board.occupied_cells():
+            row, col = divmod(index, self.width)
+            cell = self.game_board.cells[index]
+            rpos = row * CELL_SIZE + Y_OFFSET
+            cpos = col * CELL_SIZE + X_OFFSET
+            if cell > 0:
+                sprite = self.p1_sprites
+                colour = P1_COLOUR
+            else:
+                sprite = self.p2_sprites
+                colour = P2_COLOUR
+            if sprite is None:
+                # Cells too small for sprites are filled with the player's colour
+                pygame.draw.rect(window, colour, (cpos, rpos, CELL_SIZE, CELL_SIZE))
+            elif abs(cell) == 1:
+                cpos += CELL_SIZE // 2 - half
+                rpos += CELL_SIZE // 2 - half
+                window.blit(sprite[math.floor(frame)], (cpos, rpos))
+            elif abs(cell) == 2:
+                cpos += CELL_SIZE // 2 - gem
+                rpos += CELL_SIZE // 2 - half
+                window.blit(sprite[math.floor(frame)], (cpos, rpos))
+                cpos += gem
+                window.blit(sprite[math.floor(frame)], (cpos, rpos))
+
+            elif abs(cell) == 3:
+                cpos += CELL_SIZE // 2 - half
+                rpos += margin
+                window.blit(sprite[math.floor(frame)], (cpos, rpos))
+                cpos = col * CELL_SIZE + X_OFFSET + CELL_SIZE // 2 - gem
+                rpos += CELL_SIZE // 2
+                window.blit(sprite[math.floor(frame)], (cpos, rpos))
+                cpos += gem
+                window.blit(sprite[math.floor(frame)], (cpos, rpos))
+            elif abs(cell) == 4:
+                cpos += CELL_SIZE // 2 - gem
+                rpos += margin
+                window.blit(sprite[math.floor(frame)], (cpos, rpos))
+                rpos += CELL_SIZE // 2
+                window.blit(sprite[math.floor(frame)], (cpos, rpos))
+                cpos += gem
+                window.blit(sprite[math.floor(frame)], (cpos, rpos))
+                rpos -= CELL_SIZE // 2
+                window.blit(sprite[math.floor(frame)], (cpos, rpos))
 
     '''
     This method should undo the last move made by the player
@@ -196,24 +206,53 @@ class Board:
     '''
 
     def calculate_scores(self):
-        p1_score = 0
-        p2_score = 0
-        # Iterate through the board and count the number of cells occupied by each player
-        for row in range(self.height):
-            for col in range(self.width):
-                if self.game_board[row][col] > 0:
-                    p1_score += 1
-                elif self.game_board[row][col] < 0:
-                    p2_score += 1
-                    # Return the scores of player 1 and player 2
-        return p1_score, p2_score
+        # The number of cells occupied by each player, as counted by the board
+        return self.game_board.positive_cells, self.game_board.negative_cells
+
+
+USAGE = "usage: python main.py [rows cols [max_waves]]"
+
+
+"""
+Reads the board size and the optional cap on the overflow waves of one move from the command
+line, and exits with the usage if they are not a board of at least two cells and a cap of at
+least one wave.
+"""
+
+
+def parse_arguments(argv):
+    if len(argv) not in (0, 2, 3):
+        sys.exit(USAGE)
+    try:
+        numbers = [int(argument) for argument in argv]
+    except ValueError:
+        sys.exit(USAGE)
+    rows, cols = numbers[:2] if numbers else (5, 6)
+    max_waves = numbers[2] if len(numbers) == 3 else None
+    if rows < 1 or cols < 1 or rows * cols < 2:
+        sys.exit("the board needs at least one row, one column and two cells\n" + USAGE)
+    if max_waves is not None and max_waves < 1:
+        sys.exit("max_waves must be at least 1\n" + USAGE)
+    return (rows, cols), max_waves
 
 
 # Constants
-GRID_SIZE = (5, 6)
-CELL_SIZE = 100
+# The board size (rows, cols) and an optional cap on the overflow waves of one move can be given
+# on the command line: python main.py [rows cols [max_waves]]
+GRID_SIZE, MAX_WAVES = parse_arguments(sys.argv[1:])
+# Room for the board left of the controls and between the scores and the status lines; cells
+# shrink from 100 pixels so that bigger boards fit
+BOARD_AREA = (840, 590)
+CELL_SIZE = max(1, min(100, BOARD_AREA[0] // GRID_SIZE[1], BOARD_AREA[1] // GRID_SIZE[0]))
+# Size of a gem sprite on the board, and the smallest sprite and outlined cell worth drawing
+GEM_SIZE = CELL_SIZE * 32 // 100
+MIN_GEM_SIZE = 6
+MIN_OUTLINED_CELL = 8
 WHITE = (255, 255, 255)
 BLACK = (0, 0, 0)
+# Fill colours of cells too small for sprites, matching the gem images below
+P1_COLOUR = (60, 110, 230)
+P2_COLOUR = (230, 90, 170)
 X_OFFSET = 0
 Y_OFFSET = 100
 FULL_DELAY = 5
@@ -243,6 +282,17 @@ for i in range(8):
     p1_sprites.append(p1spritesheet.subsurface(curr_sprite))
     p2_sprites.append(p2spritesheet.subsurface(curr_sprite))
 
+# The sprites drawn on the board, scaled to the cells (None when the cells are too small for them)
+if GEM_SIZE == 32:
+    p1_board_sprites, p2_board_sprites = p1_sprites, p2_sprites
+elif GEM_SIZE >= MIN_GEM_SIZE:
+    p1_board_sprites = [pygame.transform.scale(sprite, (GEM_SIZE, GEM_SIZE))
+                        for sprite in p1_sprites]
+    p2_board_sprites = [pygame.transform.scale(sprite, (GEM_SIZE, GEM_SIZE))
+                        for sprite in p2_sprites]
+else:
+    p1_board_sprites, p2_board_sprites = None, None
+
 
 frame = 0
 
@@ -255,29 +305,54 @@ font = pygame.font.Font(None, 36)  # Change the size as needed
 bigfont = pygame.font.Font(None, 108)
 # Create the game board
 # board = [[0 for _ in range(GRID_SIZE[0])] for _ in range(GRID_SIZE[1])]
-player1_dropdown = Dropdown(900, 50, 200, 50, ['Human', 'AI'])
-player2_dropdown = Dropdown(900, 110, 200, 50, ['Human', 'AI'])
+player1_dropdown = Dropdown(900, 50, 200, 50, ['Human', 'AI', 'MCTS'])
+player2_dropdown = Dropdown(900, 110, 200, 50, ['Human', 'AI', 'MCTS'])
 
 
 status = ["", ""]
 current_player = 0
-board = Board(GRID_SIZE[1], GRID_SIZE[0], p1_sprites, p2_sprites)
+board = Board(GRID_SIZE[1], GRID_SIZE[0], p1_board_sprites, p2_board_sprites, MAX_WAVES)
 # Game loop
 running = True
 overflow_boards = Queue()
 overflowing = False
 numsteps = 0
 has_winner = False
-bots = [PlayerOne(), PlayerTwo()]
+# The bot of each player for each dropdown choice (None for Human)
+bots = [[None, PlayerOne(), PlayerMCTS(1)], [None, PlayerTwo(), PlayerMCTS(-1)]]
 grid_col = -1
 grid_row = -1
-choice = [None, None]
+# The dropdown choice of each player; both start on Human, the dropdowns' first option
+choice = [0, 0]
+# Seconds a bot may think per move at each difficulty
+TIME_BUDGETS = {
+    "Hard": 3.0,
+    "Normal": 1.0,
+    "Easy": 0.25,
+}
+for player_bots in bots:
+    for bot in player_bots[1:]:
+        bot.change_time_budget(TIME_BUDGETS["Hard"])
+# Bots search in a worker thread so the window keeps drawing and handling events meanwhile.
+# search_future is the running search (None when there is none), search_stop cancels it,
+# search_player is the player it is for, search_choice the bot type that runs it and search_start
+# when it began.
+search_executor = ThreadPoolExecutor(max_workers=1)
+search_future = None
+search_stop = None
+search_player = None
+search_choice = None
+search_start = 0
 # Difficulty buttons
 buttons = {
     "Hard": (850, 200, 100, 50),
     "Normal": (850, 260, 100, 50),
     "Easy": (850, 320, 100, 50),
 }
+# Button that shows or hides the search statistics of the last bot move
+stats_button = (850, 380, 100, 50)
+show_stats = False
+stats_bot = None
 
 """
 This function draws text on the window
@@ -297,6 +372,36 @@ def draw_text(window, text, position, font, color=(0, 0, 0)):
     window.blit(text_surface, position)
 
 
+"""
+This function cancels the bot search that is still running, if any.  The search stops at its
+next check of the stop event and its result is never used.
+Returns:
+    None
+"""
+
+
+def cancel_search():
+    global search_future, search_stop
+    if search_future is not None:
+        search_stop.set()
+        search_future = None
+        search_stop = None
+
+
+"""
+This function stops both bots from pondering.  Pondering is stopped before the board changes in
+a way the bots were not told about (an undo) and when the game is over.
+Returns:
+    None
+"""
+
+
+def stop_pondering():
+    for player_bots in bots:
+        for bot in player_bots[1:]:
+            bot.stop_pondering()
+
+
 while running:
     for event in pygame.event.get():
         if event.type == pygame.QUIT:
@@ -311,8 +416,13 @@ while running:
                 row = y - Y_OFFSET
                 col = x - X_OFFSET
                 grid_row, grid_col = row // CELL_SIZE, col // CELL_SIZE
-                # Check if the undo button is clicked
-                if undo_button_rect.collidepoint(x, y):
+                # Check if the undo button is clicked. Undo waits for a running overflow animation
+                # to finish: its remaining waves would otherwise be replayed on the restored board,
+                # and the turn has not passed to the next player yet.
+                if undo_button_rect.collidepoint(x, y) and not overflowing:
+                    # The board is about to change under the running search and the pondering
+                    cancel_search()
+                    stop_pondering()
                     # Check if the players are humans
                     if choice[0] == 0 and choice[1] == 0:
                         # Call the undo_last_move method in the Board class
@@ -325,27 +435,40 @@ while running:
                         # If the players are not humans undo to the last player's move
                         board.undo_last_move(player_id[current_player])
 
+                # Check the statistics button; bots only collect statistics while they are shown
+                bx, by, bwidth, bheight = stats_button
+                if bx <= x <= bx + bwidth and by <= y <= by + bheight:
+                    show_stats = not show_stats
+                    for player_bots in bots:
+                        for bot in player_bots[1:]:
+                            bot.enable_stats(show_stats)
+
                 # check difficulty buttons
                 for label, (bx, by, bwidth, bheight) in buttons.items():
                     if bx <= x <= bx + bwidth and by <= y <= by + bheight:
                         print(f"{label} button was clicked")
-                        # Change the difficulty of the bots based on the button clicked
-                        # Hard = 4, Normal = 3, Easy = 2
-                        if label == "Hard":
-                            bots[0].change_difficulty(4)
-                            bots[1].change_difficulty(4)
-                        elif label == "Normal":
-                            bots[0].change_difficulty(3)
-                            bots[1].change_difficulty(3)
-                        elif label == "Easy":
-                            bots[0].change_difficulty(2)
-                            bots[1].change_difficulty(2)
+                        # Change how long the bots think per move based on the button clicked
+                        for player_bots in bots:
+                            for bot in player_bots[1:]:
+                                bot.change_time_budget(TIME_BUDGETS[label])
+
+    # Cancel the search of a bot that was switched to Human or to another bot type
+    if search_future is not None and choice[search_player] != search_choice:
+        cancel_search()
+    # Stop the pondering of bots that are no longer playing
+    for player in range(2):
+        for option, bot in enumerate(bots[player][1:], 1):
+            if choice[player] != option:
+                bot.stop_pondering()
 
     win = board.check_win()
     if win != 0:
         winner = 1
         if win == -1:
             winner = 2
+        if not has_winner:
+            # Nothing left to ponder
+            stop_pondering()
         has_winner = True
 
     if not has_winner:
@@ -354,7 +477,7 @@ while running:
             if not overflow_boards.is_empty():
                 if repeat_step == FULL_DELAY:
                     next = overflow_boards.dequeue()
-                    board.set(next)
+                    board.apply_changes(next)
                     repeat_step = 0
                 else:
                     repeat_step += 1
@@ -367,24 +490,47 @@ while running:
         else:
             status[0] = "Player " + str(current_player + 1) + "'s turn"
             make_move = False
-            if choice[current_player] == 1:
-                (grid_row, grid_col) = bots[current_player].get_play(
-                    board.get_board())
-                status[1] = "Bot chose row {}, col {}".format(
-                    grid_row, grid_col)
-                if not board.valid_move(grid_row, grid_col, player_id[current_player]):
-                    has_winner = True
-                    # if p1 makes an invalid move, p2 wins.  if p2 makes an invalid move p1 wins
-                    winner = ((current_player + 1) % 2) + 1
+            if choice[current_player] != 0:
+                if search_future is None:
+                    # Start the bot's search in the worker thread
+                    search_stop = threading.Event()
+                    search_player = current_player
+                    search_choice = choice[current_player]
+                    search_start = time.monotonic()
+                    search_future = search_executor.submit(
+                        bots[current_player][search_choice].get_play, board.get_board(), None,
+                        search_stop)
+                elif not search_future.done():
+                    status[1] = "Bot is thinking... {:.1f}s".format(
+                        time.monotonic() - search_start)
                 else:
-                    make_move = True
+                    (grid_row, grid_col) = search_future.result()
+                    stats_bot = bots[current_player][search_choice]
+                    search_future = None
+                    search_stop = None
+                    status[1] = "Bot chose row {}, col {}".format(
+                        grid_row, grid_col)
+                    if not board.valid_move(grid_row, grid_col, player_id[current_player]):
+                        has_winner = True
+                        # if p1 makes an invalid move, p2 wins.  if p2 makes an invalid move p1 wins
+                        winner = ((current_player + 1) % 2) + 1
+                    else:
+                        make_move = True
             else:
                 if board.valid_move(grid_row, grid_col, player_id[current_player]):
                     make_move = True
 
             if make_move:
+                # Let the opposing bot know which reply it has to search against
+                opponent = (current_player + 1) % 2
+                if choice[opponent] != 0:
+                    bots[opponent][choice[opponent]].opponent_played(
+                        (grid_row, grid_col))
                 board.add_piece(grid_row, grid_col, player_id[current_player])
                 numsteps = board.do_overflow(overflow_boards)
+                # Let a bot think on a human opponent's time
+                if choice[current_player] != 0 and choice[opponent] == 0:
+                    bots[current_player][choice[current_player]].start_pondering()
                 if numsteps != 0:
                     overflowing = True
                     repeat_step = 0
@@ -441,6 +587,13 @@ while running:
     draw_button(window, "Easy", button_start_x, button_start_y +
                 2 * button_spacing, button_width, button_height)
 
+    # Button to show or hide the search statistics
+    draw_button(window, "Stats", *stats_button)
+    if show_stats and stats_bot is not None and stats_bot.stats is not None:
+        draw_text(window, stats_bot.get_name(), (850, 450), font, BLACK)
+        for line_number, line in enumerate(stats_bot.stats.summary()):
+            draw_text(window, line, (850, 480 + 30 * line_number), font, BLACK)
+
     # Draw the undo button image
     window.blit(undo_button_image, undo_button_rect)
     frame = (frame + 0.5) % 8
@@ -468,5 +621,11 @@ while running:
     pygame.display.update()
     pygame.time.delay(100)
 
+# Stop a search that is still running before leaving (closing the bots stops their pondering)
+cancel_search()
+search_executor.shutdown(wait=True)
+for player_bots in bots:
+    for bot in player_bots[1:]:
+        bot.close()
 pygame.quit()
 sys.exit()